@@ -7,24 +7,102 @@ from sqlalchemy.orm import Session
 import jwt
 from datetime import datetime, timedelta
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from typing import Optional
-from master_database import get_master_db
+from master_database import get_master_db, MasterSessionLocal
 import master_database
+from config import (
+    AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL,
+    BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE
+)
 
 # === 設定 ===
 SECRET_KEY = secrets.token_hex(32)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 7日間
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min/maxも揃えておくと、コストの違うハッシュは verify_and_update で再ハッシュされる
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
 security = HTTPBearer(auto_error=False)  # auto_error=Falseで認証なしも許可
 
+# === パスワードハッシュ専用のスレッドプール ===
+# bcryptはCPUを占有するため同時実行数を制限し、待ちが溢れたら503を返す
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE)
+_hash_stats_lock = threading.Lock()
+_hash_stats = {
+    "completed": 0,
+    "rejected": 0,
+    "wait_sec_total": 0.0,
+    "wait_sec_max": 0.0,
+    "hash_sec_total": 0.0
+}
+
+def _run_in_hash_pool(func, *args):
+    """ハッシュ処理をプールで実行して結果を待つ"""
+    if not _hash_slots.acquire(blocking=False):
+        with _hash_stats_lock:
+            _hash_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="ログインが混み合っています。しばらくしてから再度お試しください",
+            headers={"Retry-After": "5"}
+        )
+
+    submitted_at = time.monotonic()
+
+    def task():
+        started_at = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            finished_at = time.monotonic()
+            wait_sec = started_at - submitted_at
+            with _hash_stats_lock:
+                _hash_stats["completed"] += 1
+                _hash_stats["wait_sec_total"] += wait_sec
+                _hash_stats["wait_sec_max"] = max(_hash_stats["wait_sec_max"], wait_sec)
+                _hash_stats["hash_sec_total"] += finished_at - started_at
+
+    try:
+        return _hash_executor.submit(task).result()
+    finally:
+        _hash_slots.release()
+
+def get_password_hash_stats():
+    """ハッシュプールの統計（監視用）"""
+    with _hash_stats_lock:
+        stats = dict(_hash_stats)
+    completed = stats["completed"]
+    stats["wait_sec_avg"] = stats["wait_sec_total"] / completed if completed else 0.0
+    stats["hash_sec_avg"] = stats["hash_sec_total"] / completed if completed else 0.0
+    stats.update({
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "bcrypt_rounds": BCRYPT_ROUNDS
+    })
+    return stats
+
 # === 認証関数 ===
 def get_password_hash(password: str):
-    return pwd_context.hash(password)
+    return _run_in_hash_pool(pwd_context.hash, password)
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    return _run_in_hash_pool(pwd_context.verify, plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """パスワードを検証し、コストが古ければ新しいハッシュも返す (verified, new_hash)"""
+    return _run_in_hash_pool(pwd_context.verify_and_update, plain_password, hashed_password)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -33,11 +111,75 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# === 認証済みユーザーのキャッシュ ===
+@dataclass(frozen=True)
+class CurrentUser:
+    """リクエストごとに参照するユーザー情報（マスターDBのUserから作成）"""
+    id: int
+    company_id: int
+    username: str
+    name: str
+    role: str
+    staff_code: Optional[str]
+    is_active: bool
+    permissions: dict = field(default_factory=dict)
+
+# user_id -> (有効期限, CurrentUser)
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+def _load_user(user_id: int) -> Optional[CurrentUser]:
+    """キャッシュから取得、なければマスターDBから読み込む"""
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+        if cached and cached[0] > now:
+            _user_cache.move_to_end(user_id)
+            return cached[1]
+
+    db = MasterSessionLocal()
+    try:
+        user = db.query(master_database.User).filter(master_database.User.id == user_id).first()
+        if user is None:
+            return None
+        principal = CurrentUser(
+            id=user.id,
+            company_id=user.company_id,
+            username=user.username,
+            name=user.name,
+            role=user.role,
+            staff_code=user.staff_code,
+            is_active=user.is_active,
+            permissions=dict(user.permissions or {})
+        )
+    finally:
+        db.close()
+
+    with _user_cache_lock:
+        _user_cache[user_id] = (now + AUTH_USER_CACHE_TTL, principal)
+        _user_cache.move_to_end(user_id)
+        while len(_user_cache) > AUTH_USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+    return principal
+
+def invalidate_user_cache(user_id: int):
+    """ユーザー更新・削除時にキャッシュを破棄"""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+def invalidate_company_user_cache(company_id: int):
+    """会社の無効化・削除時にその会社のユーザーのキャッシュを破棄"""
+    with _user_cache_lock:
+        for user_id in [
+            user_id for user_id, (_, principal) in _user_cache.items()
+            if principal.company_id == company_id
+        ]:
+            del _user_cache[user_id]
+
 # === 認証チェック（オプション） ===
 async def get_current_user_optional(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_master_db)  # ← マスターDBに変更
-) -> Optional[master_database.User]:  # ← マスターDBのUserモデルに変更
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> Optional[CurrentUser]:
     """認証トークンがあればユーザーを返す、なければNone"""
     if not credentials:
         return None
@@ -51,14 +193,12 @@ async def get_current_user_optional(
     except jwt.PyJWTError:
         return None
     
-    user = db.query(master_database.User).filter(master_database.User.id == user_id).first()
-    return user
+    return _load_user(user_id)
 
 # === 認証必須 ===
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_master_db)  # ← マスターDBに変更
-) -> master_database.User:  # ← マスターDBのUserモデルに変更
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> CurrentUser:
     """認証必須のエンドポイント用"""
     if not credentials:
         raise HTTPException(status_code=401, detail="認証が必要です")
@@ -72,16 +212,16 @@ async def get_current_user(
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    # マスターDBのUserテーブルから取得
-    user = db.query(master_database.User).filter(master_database.User.id == user_id).first()
+    # マスターDBのUserテーブルから取得（キャッシュ経由）
+    user = _load_user(user_id)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
 # === 管理者チェック ===
 async def admin_required(
-    current_user: master_database.User = Depends(get_current_user)
-) -> master_database.User:
+    current_user: CurrentUser = Depends(get_current_user)
+) -> CurrentUser:
     """管理者権限が必要なエンドポイント用"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="管理者権限が必要です")
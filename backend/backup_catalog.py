@@ -0,0 +1,83 @@
+# backend/backup_catalog.py - バックアップの一覧（master.db の backup_catalog テーブル）
+import os
+import re
+from datetime import datetime
+from master_database import BackupCatalog
+
+BACKUP_DIR = "./backups"
+
+_COMPANY_DIR_PATTERN = re.compile(r"^company_(\d+)$")
+_SNAPSHOT_FILE_PATTERN = re.compile(r"^data/company_(\d+)\.db$")
+
+def record_company_backup(db, company_id: int, path: str, size_bytes: int,
+                          duration_sec: float = None, created_at: datetime = None):
+    """管理画面からの会社別バックアップを登録（commitは呼び出し側）"""
+    # 同じ秒に作成したバックアップは同じファイル名で上書きされるので一覧も置き換える
+    remove_location(db, path)
+    db.add(BackupCatalog(
+        kind="company",
+        company_id=company_id,
+        location=path,
+        filename=os.path.basename(path),
+        size_bytes=size_bytes,
+        duration_sec=duration_sec,
+        created_at=created_at or datetime.now()
+    ))
+
+def record_snapshot(db, manifest_path: str, manifest: dict):
+    """夜間バックアップのスナップショットをファイルごとに登録（commitは呼び出し側）"""
+    created_at = datetime.fromisoformat(manifest["created_at"])
+    for entry in manifest["files"]:
+        match = _SNAPSHOT_FILE_PATTERN.match(entry["path"])
+        db.add(BackupCatalog(
+            kind="snapshot",
+            company_id=int(match.group(1)) if match else None,
+            location=manifest_path,
+            filename=entry["path"],
+            size_bytes=entry["bytes"],
+            duration_sec=entry.get("duration_sec"),
+            created_at=created_at
+        ))
+
+def remove_location(db, location: str):
+    """ファイル（スナップショットならマニフェスト）の削除に合わせて一覧から外す"""
+    db.query(BackupCatalog).filter(BackupCatalog.location == location).delete(synchronize_session=False)
+
+def rescan_backups(db, backup_dir: str = BACKUP_DIR):
+    """backups/company_* を走査して一覧と実ファイルを揃える（追加数, 削除数）
+
+    一覧導入前のバックアップの取り込みと、手動で削除されたファイルの整理に使う
+    """
+    files = {}
+    if os.path.isdir(backup_dir):
+        for folder in os.listdir(backup_dir):
+            match = _COMPANY_DIR_PATTERN.match(folder)
+            folder_path = os.path.join(backup_dir, folder)
+            if not match or not os.path.isdir(folder_path):
+                continue
+            for filename in os.listdir(folder_path):
+                if filename.endswith(".db"):
+                    files[os.path.join(folder_path, filename)] = int(match.group(1))
+
+    added = 0
+    removed = 0
+    known = set()
+    for row in db.query(BackupCatalog.id, BackupCatalog.kind, BackupCatalog.location).all():
+        if row.kind == "company" and row.location in files:
+            known.add(row.location)
+        elif not os.path.exists(row.location):
+            db.query(BackupCatalog).filter(BackupCatalog.id == row.id).delete(synchronize_session=False)
+            removed += 1
+
+    for path, company_id in files.items():
+        if path in known:
+            continue
+        stat = os.stat(path)
+        record_company_backup(
+            db, company_id, path, stat.st_size,
+            created_at=datetime.fromtimestamp(stat.st_mtime)
+        )
+        added += 1
+
+    db.commit()
+    return added, removed
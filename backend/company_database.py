@@ -3,44 +3,287 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from fastapi import HTTPException
+from collections import OrderedDict
+import asyncio
 import os
+import threading
+import time
+from config import COMPANY_ENGINE_CACHE_SIZE, COMPANY_ENGINE_IDLE_TIMEOUT
+from sqlite_pragmas import apply_sqlite_pragmas
 
 CompanyBase = declarative_base()
 
-def get_company_engine(company_id: int):
-    """会社専用のDBエンジンを取得"""
+# === 会社DBエンジンのレジストリ（プロセス内で共有） ===
+# company_id -> _EngineEntry（末尾ほど最近使われたもの）
+_engines = OrderedDict()
+_engines_lock = threading.Lock()
+# company_id -> 作成中のエンジン用ロック（スキーマ確認は会社ごとに直列化し、全体のロックは持たない）
+_creation_locks = {}
+_last_sweep = time.monotonic()
+
+# アイドル掃除を行う間隔（秒）
+_SWEEP_INTERVAL = 60
+
+# 実行中の非同期エンジンの破棄タスク（イベントループは弱参照しか持たないため保持する）
+_dispose_tasks = set()
+
+# === 会社DBのスキーマバージョン（PRAGMA user_version に記録） ===
+# モデルを変更したらバージョンを上げ、既存テーブルへの変更は _SCHEMA_UPGRADES に追加する
+COMPANY_SCHEMA_VERSION = 5
+
+def _create_missing_indexes(conn):
+    """既存テーブルに足りないインデックスを作成"""
+    from company_models import CompanyBase
+    for table in CompanyBase.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+def _rebuild_cost_rollups(conn):
+    """既存の原価明細から月次集計を作成"""
+    from cost_rollups import rebuild_cost_rollups
+    rebuild_cost_rollups(conn)
+
+def _prepare_keyset_pagination(conn):
+    """カーソル方式の並び順の列にNULLがあれば埋め、並び順のインデックスを作成
+
+    NULLの行はカーソルの比較で飛ばされるため、古いデータも値を持つようにする。
+    統計がないと原価一覧は工事から引いて並べ替えるため、ANALYZE で並び順のインデックスを使わせる
+    """
+    conn.exec_driver_sql(
+        "UPDATE projects SET created_at = COALESCE(updated_at, '2000-01-01 00:00:00.000000') "
+        "WHERE created_at IS NULL"
+    )
+    conn.exec_driver_sql(
+        "UPDATE costs SET date = COALESCE(date(created_at), '2000-01-01') WHERE date IS NULL"
+    )
+    _create_missing_indexes(conn)
+    conn.exec_driver_sql("ANALYZE")
+
+# {バージョン: 関数(connection)} create_all の後に古い順に実行
+_SCHEMA_UPGRADES = {
+    2: _create_missing_indexes,     # 検索・集計用のインデックス追加
+    3: _rebuild_cost_rollups,       # 原価の月次集計テーブル
+    5: _prepare_keyset_pagination,  # カーソル方式の一覧用（NULLの補完とインデックス）
+}
+
+# このプロセスでスキーマ確認済みの会社ID
+_schema_checked = set()
+_bootstrap_stats = {"executed": 0, "skipped": 0}
+
+class _EngineEntry:
+    """会社ごとのエンジンとセッションファクトリ（非同期エンジンは初回利用時に作成）"""
+    __slots__ = ("engine", "session_factory", "last_used",
+                 "async_engine", "async_session_factory", "async_loop")
+
+    def __init__(self, company_id, engine):
+        self.engine = engine
+        # company_id はキャッシュのキーとして session.info から参照する
+        self.session_factory = sessionmaker(
+            autocommit=False, autoflush=False, bind=engine,
+            info={"company_id": company_id}
+        )
+        self.last_used = time.monotonic()
+        self.async_engine = None
+        self.async_session_factory = None
+        self.async_loop = None
+
+    def dispose(self):
+        """エンジンを閉じる（使用中の接続はチェックイン時に閉じられる）"""
+        self.engine.dispose()
+        if self.async_engine is not None:
+            _dispose_async_engine(self.async_engine, self.async_loop)
+
+def get_company_db_path(company_id: int) -> str:
+    """会社専用DBのパス"""
+    return f"./data/company_{company_id}.db"
+
+def _create_company_engine(company_id: int):
+    """会社専用のDBエンジンを新規作成"""
     # dataフォルダ作成
     os.makedirs("data", exist_ok=True)
-    
-    # 会社専用DBパス
-    db_path = f"./data/company_{company_id}.db"
-    
+
     # エンジン作成
     engine = create_engine(
-        f"sqlite:///{db_path}",
+        f"sqlite:///{get_company_db_path(company_id)}",
         connect_args={"check_same_thread": False}
     )
-    
-    # テーブル作成（初回のみ）
-    from company_models import CompanyBase
-    CompanyBase.metadata.create_all(bind=engine)
-    
+    apply_sqlite_pragmas(engine, "company")
+
+    # スキーマ確認はプロセスごとに1回だけ（会社ごとの作成ロック内で呼ばれる）
+    if company_id in _schema_checked:
+        executed = False
+    else:
+        executed = ensure_company_schema(engine)
+    with _engines_lock:
+        _bootstrap_stats["executed" if executed else "skipped"] += 1
+        _schema_checked.add(company_id)
+
     return engine
 
+def ensure_company_schema(engine) -> bool:
+    """スキーマが古い場合のみテーブル作成とアップグレードを実行（実行したらTrue）"""
+    with engine.connect() as conn:
+        current_version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+    if current_version >= COMPANY_SCHEMA_VERSION:
+        return False
+
+    from company_models import CompanyBase
+    with engine.begin() as conn:
+        CompanyBase.metadata.create_all(bind=conn)
+        for version in range(current_version + 1, COMPANY_SCHEMA_VERSION + 1):
+            upgrade = _SCHEMA_UPGRADES.get(version)
+            if upgrade:
+                upgrade(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {COMPANY_SCHEMA_VERSION}")
+
+    return True
+
+def _collect_idle(now: float):
+    """アイドル時間を超えたエントリをレジストリから外して返す（ロック内で呼ぶ）"""
+    global _last_sweep
+    _last_sweep = now
+    expired = [
+        company_id for company_id, entry in _engines.items()
+        if now - entry.last_used > COMPANY_ENGINE_IDLE_TIMEOUT
+    ]
+    return [_engines.pop(company_id) for company_id in expired]
+
+def _lookup_entry(company_id: int, now: float):
+    """キャッシュ済みのエントリ（なければNone）、ロック内で呼ぶ"""
+    entry = _engines.get(company_id)
+    if entry is not None:
+        entry.last_used = now
+        _engines.move_to_end(company_id)
+    return entry
+
+def _get_entry(company_id: int) -> _EngineEntry:
+    """レジストリからエントリを取得（なければ作成）
+
+    全体のロックは辞書の操作だけに使い、エンジン作成（スキーマ確認・アップグレード）は
+    会社ごとのロックで行う。他の会社の取得は作成中の会社を待たない
+    """
+    now = time.monotonic()
+    to_dispose = []
+
+    with _engines_lock:
+        if now - _last_sweep > _SWEEP_INTERVAL:
+            to_dispose.extend(_collect_idle(now))
+        entry = _lookup_entry(company_id, now)
+        if entry is None:
+            creation_lock = _creation_locks.setdefault(company_id, threading.Lock())
+
+    if entry is None:
+        with creation_lock:
+            # 待っている間に他のスレッドが作成していればそれを使う
+            with _engines_lock:
+                entry = _lookup_entry(company_id, now)
+            if entry is None:
+                try:
+                    entry = _EngineEntry(company_id, _create_company_engine(company_id))
+                    with _engines_lock:
+                        _engines[company_id] = entry
+
+                        # 上限を超えたら最も使われていない会社から閉じる
+                        while len(_engines) > COMPANY_ENGINE_CACHE_SIZE:
+                            _, evicted = _engines.popitem(last=False)
+                            to_dispose.append(evicted)
+                finally:
+                    # 作成に失敗した場合もロックを残さない（次の取得で作り直す）
+                    with _engines_lock:
+                        if _creation_locks.get(company_id) is creation_lock:
+                            del _creation_locks[company_id]
+
+    for evicted in to_dispose:
+        evicted.dispose()
+
+    return entry
+
+def get_company_engine(company_id: int):
+    """会社専用のDBエンジンを取得（プロセス内でキャッシュ）"""
+    return _get_entry(company_id).engine
+
 def get_company_session(company_id: int):
     """会社専用のセッションを取得"""
-    engine = get_company_engine(company_id)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    return SessionLocal()
+    return _get_entry(company_id).session_factory()
+
+def _create_company_async_engine(company_id: int):
+    """会社専用の非同期エンジン（aiosqlite）を新規作成"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    engine = create_async_engine(f"sqlite+aiosqlite:///{get_company_db_path(company_id)}")
+    apply_sqlite_pragmas(engine.sync_engine, "company")
+    return engine
+
+def _dispose_done(task):
+    _dispose_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ 非同期エンジンの破棄に失敗: {task.exception()}")
+
+def _start_dispose(engine):
+    """破棄タスクを開始（イベントループのスレッドで呼ぶ）"""
+    task = asyncio.ensure_future(engine.dispose())
+    _dispose_tasks.add(task)
+    task.add_done_callback(_dispose_done)
+
+def _dispose_async_engine(engine, loop):
+    """非同期エンジンを、接続を作成したイベントループ上で閉じる（どのスレッドからでも呼べる）"""
+    if loop is None or loop.is_closed():
+        engine.sync_engine.dispose(close=False)
+        return
+    loop.call_soon_threadsafe(_start_dispose, engine)
+
+def get_company_async_session(company_id: int, loop):
+    """会社専用の非同期セッションを取得
+
+    エンジンの作成・スキーマ確認でブロックするため、イベントループではなくスレッドプールで呼ぶ。
+    loop: セッションを使うイベントループ（非同期エンジンの破棄に使う）
+    """
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    entry = _get_entry(company_id)
+    if entry.async_session_factory is None:
+        with _engines_lock:
+            if entry.async_session_factory is None:
+                entry.async_engine = _create_company_async_engine(company_id)
+                entry.async_loop = loop
+                entry.async_session_factory = async_sessionmaker(
+                    entry.async_engine, autoflush=False, expire_on_commit=False,
+                    info={"company_id": company_id}
+                )
+    return entry.async_session_factory()
+
+def dispose_company_engine(company_id: int):
+    """会社のエンジンをレジストリから外して閉じる（DB削除・復旧時用）"""
+    with _engines_lock:
+        entry = _engines.pop(company_id, None)
+        _schema_checked.discard(company_id)
+    if entry is not None:
+        entry.dispose()
+
+def get_engine_registry_stats():
+    """レジストリの状態（監視用）"""
+    now = time.monotonic()
+    with _engines_lock:
+        return {
+            "open_engines": len(_engines),
+            "async_engines": sum(1 for entry in _engines.values() if entry.async_engine is not None),
+            "max_engines": COMPANY_ENGINE_CACHE_SIZE,
+            "idle_timeout_sec": COMPANY_ENGINE_IDLE_TIMEOUT,
+            "schema_version": COMPANY_SCHEMA_VERSION,
+            "bootstrap": dict(_bootstrap_stats),
+            "companies": [
+                {"company_id": company_id, "idle_sec": round(now - entry.last_used, 1)}
+                for company_id, entry in reversed(_engines.items())
+            ]
+        }
 
 # Depends用のファクトリー関数
 def get_company_db_for_user(current_user):
     """ユーザーの会社DBを取得するジェネレーター"""
     if not current_user:
         raise HTTPException(status_code=401, detail="User not authenticated")
-    
+
     db = get_company_session(current_user.company_id)
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
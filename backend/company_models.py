@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from company_database import CompanyBase
@@ -27,6 +27,13 @@ class Project(CompanyBase):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     costs = relationship("Cost", back_populates="project")
+    
+    __table_args__ = (
+        Index("ix_projects_user_id_status", "user_id", "status"),
+        Index("ix_projects_user_id_project_code", "user_id", "project_code"),
+        Index("ix_projects_status", "status"),
+        Index("ix_projects_user_id_created_at_id", "user_id", "created_at", "id"),  # カーソル方式の一覧
+    )
 
 # === 原価明細（変更なし） ===
 class Cost(CompanyBase):
@@ -48,6 +55,23 @@ class Cost(CompanyBase):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     project = relationship("Project", back_populates="costs")
+    
+    __table_args__ = (
+        Index("ix_costs_project_id_date", "project_id", "date"),
+        Index("ix_costs_category", "category"),
+        Index("ix_costs_date_id", "date", "id"),  # カーソル方式の一覧
+    )
+
+# === 原価の月次集計（工事・カテゴリ・年月ごと、原価の登録・更新・削除で更新） ===
+class CostRollup(CompanyBase):
+    __tablename__ = "cost_rollups"
+    
+    project_id = Column(Integer, primary_key=True)
+    category = Column(String, primary_key=True)     # カテゴリなしは空文字
+    year_month = Column(String, primary_key=True)   # "YYYY-MM"
+    amount = Column(Integer, default=0)             # SUM(amount)
+    total_amount = Column(Integer, default=0)       # SUM(total_amount)
+    cost_count = Column(Integer, default=0)         # 明細件数
 
 # === 業者マスタ（company_id削除） ===
 class Vendor(CompanyBase):
@@ -97,11 +121,18 @@ class SystemSettings(CompanyBase):
     __tablename__ = "system_settings"
 
     id = Column(Integer, primary_key=True, index=True)
-    key = Column(String, nullable=False)
+    key = Column(String, nullable=False, index=True)
     value = Column(Text)
     description = Column(Text)
     fiscal_start_year = Column(Integer, default=2000)    # ← ★追加：期の開始年
     fiscal_start_month = Column(Integer, default=8)      # ← ★追加：期の開始月（8月）
     staff_code_digits = Column(Integer, default=3)       # ← ★追加：担当者番号の桁数
     created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# === テーブルの更新バージョン（キャッシュ無効化用、書き込み時に更新） ===
+class TableVersion(CompanyBase):
+    __tablename__ = "table_versions"
+
+    name = Column(String, primary_key=True)   # テーブル名
+    version = Column(Integer, default=0)
@@ -0,0 +1,56 @@
+# backend/company_reader.py - 読み取り系API用の会社DBアクセス（同期/非同期を設定で切り替え）
+import asyncio
+from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
+from config import DB_ASYNC_READS
+from auth_utils import get_current_user
+from company_database import get_company_session, get_company_async_session
+
+try:
+    import aiosqlite  # noqa: F401
+    ASYNC_AVAILABLE = True
+except ImportError:
+    ASYNC_AVAILABLE = False
+
+if DB_ASYNC_READS and not ASYNC_AVAILABLE:
+    print("⚠️ DB_ASYNC_READS=true ですが aiosqlite がインストールされていないため同期モードで動作します")
+
+ASYNC_READS = DB_ASYNC_READS and ASYNC_AVAILABLE
+
+class CompanyReader:
+    """クエリ関数 fn(db, ...) を実行する
+
+    非同期モード: AsyncSession.run_sync（I/Oはaiosqliteのスレッドで実行）
+    同期モード: 同期セッションをスレッドプールで実行（従来どおり）
+    どちらも fn には同期の Session が渡されるので、クエリは共通で書ける
+    """
+
+    def __init__(self, session, is_async: bool):
+        self.session = session
+        self.is_async = is_async
+
+    async def run(self, fn, *args, **kwargs):
+        if self.is_async:
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+async def get_company_reader(current_user = Depends(get_current_user)):
+    """会社DBのリーダーを取得（Depends用）
+
+    セッションの取得は初回のエンジン作成・スキーマ確認やレジストリのロック待ちで
+    ブロックすることがあるため、イベントループではなくスレッドプールで行う
+    """
+    if ASYNC_READS:
+        session = await run_in_threadpool(
+            get_company_async_session, current_user.company_id, asyncio.get_running_loop()
+        )
+        try:
+            yield CompanyReader(session, True)
+        finally:
+            await session.close()
+    else:
+        session = await run_in_threadpool(get_company_session, current_user.company_id)
+        try:
+            yield CompanyReader(session, False)
+        finally:
+            await run_in_threadpool(session.close)
@@ -14,6 +14,71 @@ ENABLE_EMAIL_VERIFICATION = os.getenv('ENABLE_EMAIL_VERIFICATION', 'false').lowe
 APP_URL = os.getenv('APP_URL', 'http://localhost:5173')
 API_URL = os.getenv('API_URL', 'http://localhost:8000')
 
+# 読み取り系API（ダッシュボード・一覧）のDBアクセス
+# true: aiosqliteの非同期エンジン（スレッドプールを使わない） / false: 同期エンジンをスレッドプールで実行
+DB_ASYNC_READS = os.getenv('DB_ASYNC_READS', 'false').lower() == 'true'
+
+# 大きな一覧のJSONをorjsonで直接作成（response_modelの再検証を省略、orjson未インストール時は無効）
+FAST_JSON_RESPONSES = os.getenv('FAST_JSON_RESPONSES', 'true').lower() == 'true'
+
+# この大きさ（バイト）以上のレスポンスを圧縮（brotli-asgiがあればbrotli、なければgzip / 0で無効）
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+# gzipの圧縮レベル（9は6とほぼ同じサイズでCPU時間が大きい）
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+
+# 会社DBエンジンのキャッシュ設定（ワーカープロセスごと）
+COMPANY_ENGINE_CACHE_SIZE = int(os.getenv('COMPANY_ENGINE_CACHE_SIZE', 32))  # 同時に開いておく会社DBの上限
+COMPANY_ENGINE_IDLE_TIMEOUT = int(os.getenv('COMPANY_ENGINE_IDLE_TIMEOUT', 600))  # 未使用で閉じるまでの秒数
+
+# パスワードハッシュ（bcrypt）設定
+# BCRYPT_ROUNDSを変更すると、次回ログイン時に新しいコストで再ハッシュされる
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))      # 同時に計算するハッシュ数
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', 16))  # 待ち行列の上限（超えたら503）
+
+# 認証済みユーザーのキャッシュ（ワーカープロセスごと）
+# 他ワーカーでの変更はTTL経過で反映される
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', 1000))
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 60))  # 秒
+
+# 会社ごとの使用容量の集計（DB・WAL・バックアップ、1ワーカーだけが実行）
+STORAGE_ACCOUNTING_INTERVAL = int(os.getenv('STORAGE_ACCOUNTING_INTERVAL', 300))  # 集計間隔（秒）
+STORAGE_SAMPLE_RETENTION_DAYS = int(os.getenv('STORAGE_SAMPLE_RETENTION_DAYS', 180))  # 履歴の保存日数
+
+# オンラインバックアップ（sqlite3バックアップAPI）の速度調整
+# 1ステップでコピーするページ数と、ステップ間の待ち時間（秒）
+SQLITE_BACKUP_PAGES_PER_STEP = int(os.getenv('SQLITE_BACKUP_PAGES_PER_STEP', 256))
+SQLITE_BACKUP_STEP_SLEEP = float(os.getenv('SQLITE_BACKUP_STEP_SLEEP', 0.02))
+
+# SQLite PRAGMAプロファイル（接続ごとに適用、SQLITE_PROFILEで切り替え）
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'performance')
+SQLITE_PROFILES = {
+    # SQLite標準設定のまま
+    "default": {
+        "master": {},
+        "company": {}
+    },
+    # SDカード向け：WAL + synchronous=NORMALで書き込みのfsyncを減らす
+    "performance": {
+        "master": {
+            "busy_timeout": 5000,           # ミリ秒
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -8000,            # 負の値はKiB指定（約8MB）
+            "mmap_size": 64 * 1024 * 1024,
+            "temp_store": "MEMORY"
+        },
+        "company": {
+            "busy_timeout": 5000,
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -2000,            # 会社DBは接続数が多いので控えめ（約2MB）
+            "mmap_size": 32 * 1024 * 1024,
+            "temp_store": "MEMORY"
+        }
+    }
+}
+
 # プラン設定
 PLANS = {
     "free": {
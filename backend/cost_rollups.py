@@ -0,0 +1,79 @@
+# backend/cost_rollups.py - 原価の月次集計テーブルの更新
+from datetime import timedelta
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from company_models import Cost, CostRollup
+
+def add_cost_delta(deltas: dict, project_id, cost_date, category, amount, total_amount, sign: int = 1):
+    """集計の差分を deltas に加算（sign=1: 追加, -1: 取り消し）"""
+    key = (project_id, category or "", cost_date.strftime("%Y-%m"))
+    delta = deltas.setdefault(key, [0, 0, 0])
+    delta[0] += sign * (amount or 0)
+    delta[1] += sign * (total_amount or 0)
+    delta[2] += sign
+
+def add_cost(deltas: dict, cost, sign: int = 1):
+    """原価明細（ORM）1件分の差分を加算"""
+    add_cost_delta(
+        deltas, cost.project_id, cost.date, cost.category,
+        cost.amount, cost.total_amount, sign
+    )
+
+def apply_cost_deltas(db, deltas: dict):
+    """差分を集計テーブルに反映（呼び出し側のトランザクション内で実行）"""
+    rows = [
+        {
+            "project_id": project_id,
+            "category": category,
+            "year_month": year_month,
+            "amount": amount,
+            "total_amount": total_amount,
+            "cost_count": count
+        }
+        for (project_id, category, year_month), (amount, total_amount, count) in deltas.items()
+        if count or amount or total_amount
+    ]
+    if not rows:
+        return
+
+    stmt = sqlite_insert(CostRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["project_id", "category", "year_month"],
+        set_={
+            "amount": CostRollup.amount + stmt.excluded.amount,
+            "total_amount": CostRollup.total_amount + stmt.excluded.total_amount,
+            "cost_count": CostRollup.cost_count + stmt.excluded.cost_count
+        }
+    )
+    db.execute(stmt, rows)
+
+    # 明細がなくなった行は削除
+    if any(row["cost_count"] < 0 for row in rows):
+        db.query(CostRollup).filter(CostRollup.cost_count <= 0).delete(synchronize_session=False)
+
+def rebuild_cost_rollups(conn):
+    """原価明細から集計テーブルを作り直す（Session / Connection どちらでも可）"""
+    year_month = func.strftime("%Y-%m", Cost.date)
+    category = func.coalesce(Cost.category, "")
+    source = select(
+        Cost.project_id,
+        category,
+        year_month,
+        func.sum(Cost.amount),
+        func.sum(Cost.total_amount),
+        func.count(Cost.id)
+    ).group_by(Cost.project_id, category, year_month)
+
+    conn.execute(CostRollup.__table__.delete())
+    conn.execute(
+        CostRollup.__table__.insert().from_select(
+            ["project_id", "category", "year_month", "amount", "total_amount", "cost_count"],
+            source
+        )
+    )
+
+def month_range(start, end):
+    """期間が月初〜月末なら集計テーブル用の ("YYYY-MM", "YYYY-MM") を返す"""
+    if start.day != 1 or (end + timedelta(days=1)).day != 1:
+        return None
+    return start.strftime("%Y-%m"), end.strftime("%Y-%m")
@@ -0,0 +1,30 @@
+# backend/etag_utils.py - マスタ一覧の条件付きGET（ETag / If-None-Match）
+from fastapi import Response
+from table_versions import get_table_version
+
+# ブラウザに保存させ、毎回 If-None-Match で再検証させる
+ETAG_CACHE_CONTROL = "private, no-cache"
+
+def table_etag(db, *names) -> str:
+    """テーブルのバージョンから一覧のETagを作成（会社IDを含める）
+
+    書き込み時はデータとバージョンを同じトランザクションで更新するので、一覧より先に読めば
+    ETagがデータより新しくなることはない（古い場合は次回取り直すだけ）
+    """
+    versions = "-".join(str(get_table_version(db, name)) for name in names)
+    return f'W/"{db.info["company_id"]}-{versions}"'
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """If-None-Match が ETag に一致するか（弱い比較）"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = ETAG_CACHE_CONTROL
+
+def not_modified(etag: str) -> Response:
+    """304レスポンス（一覧の取得・シリアライズは行わない）"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL})
@@ -0,0 +1,104 @@
+# backend/export_utils.py - CSV/XLSXのストリーミング出力
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from company_database import get_company_session
+
+EXPORT_BATCH_SIZE = 1000         # DBから一度に取り出す行数
+EXPORT_FLUSH_BYTES = 64 * 1024   # この大きさごとにクライアントへ送る
+EXPORT_FORMATS = ("csv", "xlsx")
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def require_export_permission(current_user):
+    """エクスポート権限（export_data）のチェック、管理者は常に可"""
+    if current_user.role != "admin" and not current_user.permissions.get("export_data"):
+        raise HTTPException(status_code=403, detail="エクスポート権限がありません")
+
+def _format_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+def _iter_rows(company_id, build_query):
+    """会社DBから行を少しずつ取り出す（レスポンス送信中もセッションを保持）"""
+    db = get_company_session(company_id)
+    try:
+        for row in build_query(db).yield_per(EXPORT_BATCH_SIZE):
+            yield row
+    finally:
+        db.close()
+
+def _iter_csv(company_id, build_query, headers):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # Excelで文字化けしないようBOM付き
+    buffer.write("﻿")
+    writer.writerow(headers)
+
+    for row in _iter_rows(company_id, build_query):
+        writer.writerow([_format_value(value) for value in row])
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode("utf-8")
+
+def _iter_xlsx(company_id, build_query, headers, sheet_title):
+    """XLSXは一時ファイルに書き出してから送る（ストリーミングではない）
+
+    openpyxl の write_only はメモリは一定だが、zipの作成は save で全行を書いた後になるため、
+    送信開始はクエリの完了後になる
+    """
+    from openpyxl import Workbook
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title=sheet_title)
+        sheet.append(headers)
+        for row in _iter_rows(company_id, build_query):
+            sheet.append(list(row))
+        workbook.save(path)
+
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(EXPORT_FLUSH_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+def export_response(company_id, build_query, headers, file_prefix, export_format="csv"):
+    """build_query(db) の結果をCSV/XLSXのStreamingResponseで返す"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"formatは {', '.join(EXPORT_FORMATS)} のいずれかです")
+
+    filename = f"{file_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    response_headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    if export_format == "xlsx":
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=400, detail="XLSX出力には openpyxl のインストールが必要です")
+        return StreamingResponse(
+            _iter_xlsx(company_id, build_query, headers, file_prefix),
+            media_type=XLSX_MEDIA_TYPE,
+            headers=response_headers
+        )
+
+    return StreamingResponse(
+        _iter_csv(company_id, build_query, headers),
+        media_type="text/csv; charset=utf-8",
+        headers=response_headers
+    )
@@ -0,0 +1,56 @@
+# backend/fast_json.py - 大きな一覧レスポンスの高速シリアライズ（orjson）
+"""
+FAST_JSON_RESPONSES=true かつ orjson がインストールされている場合、
+ORMの行をスキーマの項目だけの dict にして orjson で直接JSONにする。
+response_model による再検証を行わないため、DBから読んだ信頼できる値にだけ使う。
+無効な場合は値をそのまま返し、従来どおり response_model で検証・シリアライズする
+"""
+from fastapi.responses import JSONResponse
+from config import FAST_JSON_RESPONSES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_JSON = FAST_JSON_RESPONSES and orjson is not None
+
+class FastJSONResponse(JSONResponse):
+    """orjson でシリアライズするレスポンス（date/datetime はISO形式）"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+def _field_names(schema):
+    return tuple(schema.model_fields)
+
+def orm_rows(rows, schema):
+    """ORMの行をスキーマの項目だけの dict のリストにする"""
+    names = _field_names(schema)
+    return [{name: getattr(row, name) for name in names} for row in rows]
+
+def orm_list_response(rows, schema):
+    """ORMの行のリスト（response_model=List[schema]）"""
+    if not FAST_JSON:
+        return rows
+    return FastJSONResponse(orm_rows(rows, schema))
+
+def orm_page_response(page, schema):
+    """カーソル方式のページ {"items", "next_cursor"}"""
+    if not FAST_JSON:
+        return page
+    return FastJSONResponse({"items": orm_rows(page["items"], schema), "next_cursor": page["next_cursor"]})
+
+def json_response(content, response=None):
+    """dict・list・日付だけからなる集計結果
+
+    response: Depends で受け取った Response（設定済みのヘッダーを引き継ぐ）
+    """
+    if not FAST_JSON:
+        return content
+    fast_response = FastJSONResponse(content)
+    if response is not None:
+        for name, value in response.headers.items():
+            if name != "content-length":
+                fast_response.headers[name] = value
+    return fast_response
@@ -13,8 +13,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "ETag"],  # 一覧の総件数、マスタ一覧のETag
 )
 
+# レスポンスの圧縮（brotli-asgi があれば brotli、非対応のクライアントと未インストール時は gzip）
+from config import COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL
+if COMPRESSION_MIN_SIZE > 0:
+    try:
+        from brotli_asgi import BrotliMiddleware
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+    except ImportError:
+        from starlette.middleware.gzip import GZipMiddleware
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE, compresslevel=COMPRESSION_GZIP_LEVEL)
+
 @app.on_event("startup")
 def startup_event():
     """
@@ -27,6 +38,20 @@ def startup_event():
     from master_database import init_master_db
     init_master_db()
     
+    # バックアップ一覧が空なら既存のバックアップファイルを取り込む
+    from master_database import MasterSessionLocal, BackupCatalog
+    from backup_catalog import rescan_backups
+    db = MasterSessionLocal()
+    try:
+        if db.query(BackupCatalog.id).first() is None:
+            rescan_backups(db)
+    finally:
+        db.close()
+    
+    # 会社ごとの使用容量をバックグラウンドで集計
+    from storage_accounting import start_storage_accounting
+    start_storage_accounting()
+    
     print("✅ システム起動完了")
 
 # ルーターの登録
@@ -43,6 +68,11 @@ app.include_router(settings.router)
 app.include_router(dashboard.router)
 app.include_router(users.router)
 
+@app.on_event("shutdown")
+def shutdown_event():
+    from storage_accounting import stop_storage_accounting
+    stop_storage_accounting()
+
 @app.get("/")
 def read_root():
     return {
@@ -1,5 +1,5 @@
 # backend/master_database.py
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, UniqueConstraint
+from sqlalchemy import create_engine, Column, Integer, BigInteger, Float, String, DateTime, Boolean, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.types import JSON 
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 import random
 import string
 import secrets
+from sqlite_pragmas import apply_sqlite_pragmas
 
 MasterBase = declarative_base()
 
@@ -65,8 +66,68 @@ class SuperAdmin(MasterBase):
     password_hash = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
+# === 会社ごとの使用容量（storage_accounting がバックグラウンドで更新） ===
+class StorageUsage(MasterBase):
+    __tablename__ = "storage_usage"
+    
+    company_id = Column(Integer, primary_key=True)
+    db_bytes = Column(BigInteger, default=0)       # company_{id}.db
+    wal_bytes = Column(BigInteger, default=0)      # -wal / -shm
+    backup_bytes = Column(BigInteger, default=0)   # backups/company_{id}/
+    total_bytes = Column(BigInteger, default=0, index=True)
+    updated_at = Column(DateTime, default=datetime.now)
+
+# 使用容量の履歴（変化があったときに記録、増加傾向の確認用）
+class StorageSample(MasterBase):
+    __tablename__ = "storage_samples"
+    
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, nullable=False)
+    sampled_at = Column(DateTime, default=datetime.now, nullable=False)
+    db_bytes = Column(BigInteger, default=0)
+    wal_bytes = Column(BigInteger, default=0)
+    backup_bytes = Column(BigInteger, default=0)
+    total_bytes = Column(BigInteger, default=0)
+    
+    __table_args__ = (
+        Index("ix_storage_samples_company_id_sampled_at", "company_id", "sampled_at"),
+    )
+
+# === バックアップの一覧（backup_catalog から更新、一覧APIはこのテーブルを検索） ===
+class BackupCatalog(MasterBase):
+    __tablename__ = "backup_catalog"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)     # company: 管理画面からの会社別 / snapshot: 夜間バックアップ
+    company_id = Column(Integer)              # master.db はNULL
+    location = Column(String, nullable=False) # company: ファイルのパス / snapshot: マニフェストのパス
+    filename = Column(String, nullable=False) # company: ファイル名 / snapshot: スナップショット内のパス
+    size_bytes = Column(BigInteger, default=0)
+    duration_sec = Column(Float)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("location", "filename", name="_backup_location_filename_uc"),
+        Index("ix_backup_catalog_company_id_created_at", "company_id", "created_at"),
+        Index("ix_backup_catalog_created_at", "created_at"),
+    )
+
+# バックアップの検証結果（scripts/verify_backups.py が記録）
+class BackupVerification(MasterBase):
+    __tablename__ = "backup_verifications"
+    
+    id = Column(Integer, primary_key=True)
+    catalog_id = Column(Integer, nullable=False, index=True)  # backup_catalog.id
+    verified_at = Column(DateTime, default=datetime.now, nullable=False)
+    ok = Column(Boolean, nullable=False)
+    check_type = Column(String)       # quick_check / integrity_check
+    duration_sec = Column(Float)
+    row_counts = Column(JSON)         # {テーブル名: 件数}
+    detail = Column(String)           # 失敗時の内容
+
 # DB接続
 master_engine = create_engine("sqlite:///./master.db")
+apply_sqlite_pragmas(master_engine, "master")
 MasterSessionLocal = sessionmaker(bind=master_engine)
 
 def get_master_db():
@@ -0,0 +1,44 @@
+# backend/pagination.py - カーソル方式のページング
+import base64
+import json
+from datetime import date, datetime
+from fastapi import HTTPException
+from sqlalchemy import or_, and_
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    """(並び順の値, id) を不透明なカーソル文字列に変換"""
+    payload = json.dumps([sort_value.isoformat(), row_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, value_type):
+    """カーソル文字列を (並び順の値, id) に戻す（value_type: date / datetime）"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return value_type.fromisoformat(sort_value), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def apply_keyset(query, sort_column, id_column, cursor: str, value_type, limit: int):
+    """(sort_column, id) 順で cursor の次から limit+1 件を取得するクエリにする
+
+    cursor が空文字なら先頭ページ。1件多く取得して次ページの有無を判定する
+    """
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, value_type)
+        query = query.filter(
+            or_(
+                sort_column > last_value,
+                and_(sort_column == last_value, id_column > last_id)
+            )
+        )
+    return query.order_by(sort_column, id_column).limit(limit + 1)
+
+def build_page(rows, sort_attr: str, limit: int):
+    """limit+1 件の結果から {"items", "next_cursor"} を作成"""
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and items:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_attr), last.id)
+    return {"items": items, "next_cursor": next_cursor}
@@ -2,14 +2,18 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from datetime import datetime
+from dataclasses import asdict
 import schemas
 from master_database import get_master_db, generate_company_code, generate_verification_token
 import master_database
-from auth_utils import get_password_hash, verify_password, create_access_token, get_current_user
+from auth_utils import get_password_hash, verify_and_update_password, create_access_token, get_current_user, invalidate_company_user_cache
 from config import ENABLE_EMAIL_VERIFICATION, APP_URL, PLANS
 
 router = APIRouter(prefix="/api/auth", tags=["認証"])
 
+# /me で返さない会社の項目
+COMPANY_PRIVATE_FIELDS = ("verification_token",)
+
 @router.post("/register")
 def register(
     user_data: schemas.UserCreate,
@@ -79,9 +83,17 @@ def login(
         master_database.User.company_id == company.id
     ).first()
     
-    if not user or not verify_password(credentials.password, user.password_hash):
+    if not user:
+        raise HTTPException(status_code=401, detail="認証に失敗しました")
+    
+    verified, new_hash = verify_and_update_password(credentials.password, user.password_hash)
+    if not verified:
         raise HTTPException(status_code=401, detail="認証に失敗しました")
     
+    # ハッシュのコストが設定と違う場合は再ハッシュして保存
+    if new_hash:
+        user.password_hash = new_hash
+    
     # ログイン時刻更新
     company.last_login_at = datetime.now()
     user.last_login_at = datetime.now()
@@ -97,16 +109,22 @@ def login(
     }
 
 @router.get("/me")
-def get_me(current_user = Depends(get_current_user)):
-    """現在のユーザー情報取得"""
-    db = next(get_master_db())
+def get_me(
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_master_db)
+):
+    """現在のユーザー情報取得（ユーザーは認証済みの情報を返し、パスワードハッシュは含めない）"""
     company = db.query(master_database.Company).filter(
         master_database.Company.id == current_user.company_id
     ).first()
     
     return {
-        "user": current_user,
-        "company": company
+        "user": asdict(current_user),
+        "company": {
+            column.name: getattr(company, column.name)
+            for column in master_database.Company.__table__.columns
+            if column.name not in COMPANY_PRIVATE_FIELDS
+        } if company else None
     }
 
 # ========== 将来のWeb公開用機能（環境変数で制御） ==========
@@ -210,13 +228,11 @@ def verify_email(
         admin_user.is_active = True
     
     db.commit()
+    invalidate_company_user_cache(company.id)
     
-    # 会社専用DBを初期化
-    from company_database import get_company_engine, get_company_session
-    from company_models import CompanyBase, CostCategory, SystemSettings
-    
-    engine = get_company_engine(company.id)
-    CompanyBase.metadata.create_all(bind=engine)
+    # 会社専用DBを初期化（エンジン作成時にスキーマを作成）
+    from company_database import get_company_session
+    from company_models import CostCategory, SystemSettings
     
     # 初期データ投入
     company_db = get_company_session(company.id)
@@ -242,6 +258,10 @@ def verify_email(
         setting = SystemSettings(**setting_data)
         company_db.add(setting)
     
+    from settings_cache import invalidate_settings
+    from table_versions import bump_table_version
+    invalidate_settings(company_db)
+    bump_table_version(company_db, "cost_categories")
     company_db.commit()
     company_db.close()
     
@@ -1,13 +1,19 @@
 # routers/categories.py - 会社DB対応完全版
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from typing import List
 import schemas
 import company_models
 from auth_utils import get_current_user
+from company_reader import CompanyReader, get_company_reader
+from table_versions import bump_table_version
+from etag_utils import table_etag, etag_matches, set_etag, not_modified
 
 router = APIRouter(prefix="/api/categories", tags=["カテゴリ"])
 
+# 一覧のETag用（書き込み時にバージョンを上げる）
+CATEGORIES_TABLE = "cost_categories"
+
 def get_db(current_user = Depends(get_current_user)):
     """会社DBを取得"""
     from company_database import get_company_session
@@ -18,10 +24,20 @@ def get_db(current_user = Depends(get_current_user)):
         db.close()
 
 @router.get("", response_model=List[schemas.Category])
-def get_categories(
-    db: Session = Depends(get_db),
+async def get_categories(
+    request: Request,
+    response: Response,
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    return await reader.run(_get_categories, current_user, request.headers.get("If-None-Match"), response)
+
+def _get_categories(db: Session, current_user, if_none_match, response):
+    etag = table_etag(db, CATEGORIES_TABLE)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
     # 会社DBからカテゴリを取得（company_idフィルタ不要）
     categories = db.query(company_models.CostCategory).filter(
         company_models.CostCategory.is_active == True
@@ -36,6 +52,7 @@ def create_category(
 ):
     db_category = company_models.CostCategory(**category.dict())
     db.add(db_category)
+    bump_table_version(db, CATEGORIES_TABLE)
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -62,6 +79,7 @@ def update_category(
     for key, value in update_data.items():
         setattr(db_category, key, value)
     
+    bump_table_version(db, CATEGORIES_TABLE)
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -84,5 +102,6 @@ def delete_category(
         raise HTTPException(status_code=400, detail="Cannot delete default category")
     
     db.delete(db_category)
+    bump_table_version(db, CATEGORIES_TABLE)
     db.commit()
     return {"message": "Category deleted successfully"}
\ No newline at end of file
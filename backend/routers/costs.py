@@ -1,14 +1,34 @@
 # routers/costs.py - 会社DB対応完全版
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+from sqlalchemy import insert, update, delete
+from pydantic import ValidationError
+from typing import List, Optional, Union
+from datetime import datetime, date
+import codecs
+import csv
+import io
 import schemas
 import company_models
+from cost_rollups import add_cost, add_cost_delta, apply_cost_deltas
+from pagination import apply_keyset, build_page
+from export_utils import export_response, require_export_permission
 from auth_utils import get_current_user
+from company_reader import CompanyReader, get_company_reader
+from fast_json import orm_list_response, orm_page_response
 
 router = APIRouter(prefix="/api/costs", tags=["原価"])
 
+# CSV一括登録の設定
+IMPORT_BATCH_SIZE = 1000     # 1トランザクションで登録する行数
+IMPORT_MAX_ERRORS = 1000     # レスポンスに含めるエラー行の上限
+IMPORT_AMOUNT_FIELDS = ("amount", "tax_amount", "total_amount")
+
+# 一括更新の設定
+BATCH_MAX_OPERATIONS = 500   # 1リクエストの操作数の上限
+BATCH_OPS = ("create", "update", "delete")
+BATCH_REQUIRED_FIELDS = ("project_id", "date", "vendor", "amount", "total_amount")
+
 def get_db(current_user = Depends(get_current_user)):
     """会社DBを取得"""
     from company_database import get_company_session
@@ -18,14 +38,22 @@ def get_db(current_user = Depends(get_current_user)):
     finally:
         db.close()
 
-@router.get("", response_model=List[schemas.Cost])
-def get_costs(
+@router.get("", response_model=Union[List[schemas.Cost], schemas.CostPage])
+async def get_costs(
     project_id: Optional[int] = None,
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    """原価一覧（cursorを指定すると (date, id) 順のカーソル方式、cursor= で先頭ページ）"""
+    result = await reader.run(_get_costs, current_user, project_id, skip, limit, cursor)
+    if cursor is not None:
+        return orm_page_response(result, schemas.Cost)
+    return orm_list_response(result, schemas.Cost)
+
+def _get_costs(db: Session, current_user, project_id, skip, limit, cursor):
     # 工事とJOINして、current_userの工事に紐付く原価のみ取得
     query = db.query(company_models.Cost).join(
         company_models.Project
@@ -36,9 +64,77 @@ def get_costs(
     if project_id:
         query = query.filter(company_models.Cost.project_id == project_id)
     
+    if cursor is not None:
+        rows = apply_keyset(
+            query, company_models.Cost.date, company_models.Cost.id, cursor, date, limit
+        ).all()
+        return build_page(rows, "date", limit)
+    
     costs = query.offset(skip).limit(limit).all()
     return costs
 
+# エクスポートの列（CSV一括登録の列名と同じ）
+EXPORT_COST_COLUMNS = (
+    ("id", company_models.Cost.id),
+    ("project_code", company_models.Project.project_code),
+    ("project_id", company_models.Cost.project_id),
+    ("date", company_models.Cost.date),
+    ("vendor", company_models.Cost.vendor),
+    ("description", company_models.Cost.description),
+    ("category", company_models.Cost.category),
+    ("amount", company_models.Cost.amount),
+    ("tax_type", company_models.Cost.tax_type),
+    ("tax_amount", company_models.Cost.tax_amount),
+    ("total_amount", company_models.Cost.total_amount),
+    ("payment_status", company_models.Cost.payment_status),
+    ("payment_date", company_models.Cost.payment_date),
+)
+
+@router.get("/export")
+def export_costs(
+    format: str = "csv",
+    project_id: Optional[int] = None,
+    period: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    vendor: Optional[str] = None,
+    current_user = Depends(get_current_user)
+):
+    """原価明細のエクスポート（CSV/XLSX、管理者は会社全体・それ以外は自分の工事）
+    
+    CSVは取得しながら順に送る。XLSXは全行を一時ファイルに書き出してから送るため、
+    最初のバイトが届くのはクエリの完了後になる（大量の場合はCSVを使う）
+    """
+    require_export_permission(current_user)
+    
+    def build_query(db):
+        Cost = company_models.Cost
+        Project = company_models.Project
+        query = db.query(*[column for _, column in EXPORT_COST_COLUMNS]).join(
+            Project, Cost.project_id == Project.id
+        )
+        if current_user.role != "admin":
+            query = query.filter(Project.user_id == current_user.id)
+        if project_id:
+            query = query.filter(Cost.project_id == project_id)
+        if period:
+            query = query.filter(Project.period == period)
+        if date_from:
+            query = query.filter(Cost.date >= date_from)
+        if date_to:
+            query = query.filter(Cost.date <= date_to)
+        if vendor:
+            query = query.filter(Cost.vendor.contains(vendor))
+        return query.order_by(Cost.date, Cost.id)
+    
+    return export_response(
+        current_user.company_id,
+        build_query,
+        [name for name, _ in EXPORT_COST_COLUMNS],
+        "costs",
+        format
+    )
+
 @router.post("", response_model=schemas.Cost)
 def create_cost(
     cost: schemas.CostCreate,
@@ -55,10 +151,291 @@ def create_cost(
     
     db_cost = company_models.Cost(**cost.dict())
     db.add(db_cost)
+    db.flush()  # デフォルト値を反映してから集計
+    
+    # 月次集計も同じトランザクションで更新
+    deltas = {}
+    add_cost(deltas, db_cost)
+    apply_cost_deltas(db, deltas)
+    
     db.commit()
     db.refresh(db_cost)
     return db_cost
 
+@router.post("/import")
+def import_costs(
+    file: UploadFile = File(...),
+    encoding: str = "utf-8-sig",
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """原価明細をCSV/TSVで一括登録
+    
+    1行目は列名（schemas.CostCreateの項目名）。project_id の代わりに project_code（工事番号）も指定可能。
+    登録できる工事は管理者は会社内のすべて、それ以外は自分の工事（project_id・project_code とも同じ）。
+    エラー行は飛ばして行ごとに報告する。IMPORT_BATCH_SIZE 行ごとに確定するため、ファイルが途中で
+    読めなくなった場合は、それまでの行は登録済み（400の detail.imported に件数）
+    """
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"未対応の文字コードです: {encoding}")
+    
+    # 登録できる工事のIDと、工事番号 -> 工事ID（会社内で重複する番号は None）を1回で取得
+    project_query = db.query(company_models.Project.id, company_models.Project.project_code)
+    if current_user.role != "admin":
+        project_query = project_query.filter(company_models.Project.user_id == current_user.id)
+    project_ids = set()
+    project_codes = {}
+    for project_id, project_code in project_query.all():
+        project_ids.add(project_id)
+        project_codes[project_code] = None if project_code in project_codes else project_id
+    
+    imported = 0
+    error_count = 0
+    errors = []
+    batch = []
+    
+    def add_error(line_no, messages):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"row": line_no, "errors": messages})
+    
+    def flush_batch():
+        nonlocal imported
+        if not batch:
+            return
+        db.execute(insert(company_models.Cost), batch)
+        
+        # 月次集計も同じトランザクションで更新
+        deltas = {}
+        for row in batch:
+            add_cost_delta(
+                deltas, row["project_id"], row["date"], row["category"],
+                row["amount"], row["total_amount"]
+            )
+        apply_cost_deltas(db, deltas)
+        
+        db.commit()
+        imported += len(batch)
+        batch.clear()
+    
+    # ファイル全体は読み込まず1行ずつ処理
+    stream = io.TextIOWrapper(file.file, encoding=encoding, newline="")
+    try:
+        header_line = stream.readline()
+        is_tsv = (file.filename or "").lower().endswith(".tsv") or (
+            "\t" in header_line and "," not in header_line
+        )
+        reader = csv.DictReader(
+            _chain_line(header_line, stream),
+            delimiter="\t" if is_tsv else ","
+        )
+        
+        for line_no, row in enumerate(reader, start=2):
+            data = {
+                key.strip(): value.strip()
+                for key, value in row.items()
+                if key and isinstance(value, str) and value.strip() != ""
+            }
+            for field in IMPORT_AMOUNT_FIELDS:
+                if field in data:
+                    data[field] = data[field].replace(",", "")
+            
+            project_code = data.pop("project_code", None)
+            if "project_id" not in data and project_code is not None:
+                if project_code not in project_codes:
+                    add_error(line_no, [f"project_code: 工事番号 '{project_code}' が見つかりません"])
+                    continue
+                if project_codes[project_code] is None:
+                    add_error(line_no, [f"project_code: 工事番号 '{project_code}' が複数あります（project_id を指定してください）"])
+                    continue
+                data["project_id"] = project_codes[project_code]
+            
+            try:
+                cost = schemas.CostCreate(**data)
+            except ValidationError as e:
+                add_error(line_no, _validation_messages(e))
+                continue
+            
+            if cost.project_id not in project_ids:
+                add_error(line_no, [f"project_id: 工事ID {cost.project_id} が見つからないか、登録の権限がありません"])
+                continue
+            
+            batch.append(cost.dict())
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush_batch()
+        
+        flush_batch()
+    except (UnicodeDecodeError, csv.Error) as e:
+        # 確定済みのバッチは残るので、登録済みの行数を返す
+        db.rollback()
+        if isinstance(e, UnicodeDecodeError):
+            message = f"文字コード {encoding} として読み込めません"
+        else:
+            message = f"CSVの形式が正しくありません: {e}"
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "message": f"{message}（{imported}行は登録済み）",
+                "imported": imported,
+                "failed": error_count,
+                "errors": errors
+            }
+        )
+    finally:
+        stream.detach()
+    
+    return {
+        "imported": imported,
+        "failed": error_count,
+        "errors": errors
+    }
+
+@router.post("/batch")
+def batch_costs(
+    batch: schemas.CostBatch,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """原価明細の登録・更新・削除をまとめて1トランザクションで実行
+    
+    1件でもエラーがあれば何も反映せず、操作ごとの結果を400で返す
+    """
+    Cost = company_models.Cost
+    operations = batch.operations
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"操作は{BATCH_MAX_OPERATIONS}件までです")
+    
+    # 更新・削除対象の変更前の行と、会社内の工事IDを1回ずつ取得
+    target_ids = {op.id for op in operations if op.op in ("update", "delete") and op.id}
+    old_rows = {
+        cost.id: cost
+        for cost in db.query(Cost).filter(Cost.id.in_(target_ids)).all()
+    } if target_ids else {}
+    project_ids = {project_id for (project_id,) in db.query(company_models.Project.id).all()}
+    
+    results = []
+    creates = []   # (結果のindex, 登録する値)
+    updates = []   # (結果のindex, 変更前の行, 変更する値)
+    deletes = []   # 変更前の行
+    seen_ids = set()
+    has_error = False
+    
+    for index, op in enumerate(operations):
+        errors = []
+        values = None
+        
+        if op.op not in BATCH_OPS:
+            errors.append(f"op: {', '.join(BATCH_OPS)} のいずれかを指定してください")
+        elif op.op == "create":
+            try:
+                values = schemas.CostCreate(**(op.data or {})).dict()
+            except ValidationError as e:
+                errors.extend(_validation_messages(e))
+        else:
+            if not op.id:
+                errors.append("id: 必須です")
+            elif op.id in seen_ids:
+                errors.append(f"id: 明細 {op.id} が複数回指定されています")
+            elif op.id not in old_rows:
+                errors.append(f"id: 明細 {op.id} が見つかりません")
+            if op.id:
+                seen_ids.add(op.id)
+            if op.op == "update":
+                try:
+                    values = schemas.CostUpdate(**(op.data or {})).dict(exclude_unset=True)
+                except ValidationError as e:
+                    errors.extend(_validation_messages(e))
+                else:
+                    errors.extend(
+                        f"{field}: nullは指定できません"
+                        for field in BATCH_REQUIRED_FIELDS
+                        if field in values and values[field] is None
+                    )
+        
+        if values and "project_id" in values and values["project_id"] not in project_ids:
+            errors.append(f"project_id: 工事ID {values['project_id']} が見つかりません")
+        
+        if errors:
+            has_error = True
+            results.append({"index": index, "op": op.op, "id": op.id, "status": "error", "errors": errors})
+            continue
+        
+        results.append({"index": index, "op": op.op, "id": op.id, "status": "ok"})
+        if op.op == "create":
+            creates.append((index, values))
+        elif op.op == "update":
+            updates.append((index, old_rows[op.id], values))
+        else:
+            deletes.append(old_rows[op.id])
+    
+    if has_error:
+        raise HTTPException(status_code=400, detail={"message": "エラーがあるため反映していません", "results": results})
+    
+    # 月次集計は変更前を取り消して変更後を加算
+    deltas = {}
+    now = datetime.now()
+    
+    if creates:
+        # 集計はデフォルト値の反映後の値で行う
+        inserted = db.execute(
+            insert(Cost).returning(
+                Cost.id, Cost.project_id, Cost.date, Cost.category,
+                Cost.amount, Cost.total_amount, sort_by_parameter_order=True
+            ),
+            [values for _, values in creates]
+        ).all()
+        for (index, _), row in zip(creates, inserted):
+            results[index]["id"] = row.id
+            add_cost(deltas, row)
+    
+    if updates:
+        rows = []
+        for _, old, values in updates:
+            add_cost(deltas, old, -1)
+            merged = {
+                field: values.get(field, getattr(old, field))
+                for field in ("project_id", "date", "category", "amount", "total_amount")
+            }
+            add_cost_delta(
+                deltas, merged["project_id"], merged["date"], merged["category"],
+                merged["amount"], merged["total_amount"]
+            )
+            rows.append({**values, "id": old.id, "updated_at": now})
+        db.execute(update(Cost), rows)
+    
+    if deletes:
+        for old in deletes:
+            add_cost(deltas, old, -1)
+        db.execute(
+            delete(Cost).where(Cost.id.in_([old.id for old in deletes])),
+            execution_options={"synchronize_session": False}
+        )
+    
+    apply_cost_deltas(db, deltas)
+    db.commit()
+    
+    return {
+        "created": len(creates),
+        "updated": len(updates),
+        "deleted": len(deletes),
+        "results": results
+    }
+
+def _validation_messages(error: ValidationError):
+    """pydanticのエラーを「項目: 内容」の一覧にする"""
+    return [
+        f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}"
+        for err in error.errors()
+    ]
+
+def _chain_line(first_line, stream):
+    """読み込み済みの1行目とストリームの残りを続けて返す"""
+    yield first_line
+    yield from stream
+
 @router.put("/{cost_id}", response_model=schemas.Cost)
 def update_cost(
     cost_id: int,
@@ -73,9 +450,17 @@ def update_cost(
     if not db_cost:
         raise HTTPException(status_code=404, detail="Cost not found")
     
+    # 月次集計は変更前を取り消して変更後を加算
+    deltas = {}
+    add_cost(deltas, db_cost, -1)
+    
     update_data = cost.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_cost, key, value)
+    db.flush()
+    
+    add_cost(deltas, db_cost)
+    apply_cost_deltas(db, deltas)
     
     db_cost.updated_at = datetime.now()
     db.commit()
@@ -95,6 +480,10 @@ def delete_cost(
     if not db_cost:
         raise HTTPException(status_code=404, detail="Cost not found")
     
+    deltas = {}
+    add_cost(deltas, db_cost, -1)
+    apply_cost_deltas(db, deltas)
+    
     db.delete(db_cost)
     db.commit()
     return {"message": "Cost deleted successfully"}
\ No newline at end of file
@@ -1,14 +1,20 @@
 # routers/customers.py - 会社DB対応完全版
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime
 import schemas
 import company_models
 from auth_utils import get_current_user
+from company_reader import CompanyReader, get_company_reader
+from table_versions import bump_table_version
+from etag_utils import table_etag, etag_matches, set_etag, not_modified
 
 router = APIRouter(prefix="/api/customers", tags=["顧客"])
 
+# 一覧のETag用（書き込み時にバージョンを上げる）
+CUSTOMERS_TABLE = "customers"
+
 def get_db(current_user = Depends(get_current_user)):
     """会社DBを取得"""
     from company_database import get_company_session
@@ -19,10 +25,20 @@ def get_db(current_user = Depends(get_current_user)):
         db.close()
 
 @router.get("", response_model=List[schemas.Customer])
-def get_customers(
-    db: Session = Depends(get_db),
+async def get_customers(
+    request: Request,
+    response: Response,
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    return await reader.run(_get_customers, current_user, request.headers.get("If-None-Match"), response)
+
+def _get_customers(db: Session, current_user, if_none_match, response):
+    etag = table_etag(db, CUSTOMERS_TABLE)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
     customers = db.query(company_models.Customer).filter(
         company_models.Customer.is_active == True
     ).all()
@@ -36,6 +52,7 @@ def create_customer(
 ):
     db_customer = company_models.Customer(**customer.dict())
     db.add(db_customer)
+    bump_table_version(db, CUSTOMERS_TABLE)
     db.commit()
     db.refresh(db_customer)
     return db_customer
@@ -59,6 +76,7 @@ def update_customer(
         setattr(db_customer, key, value)
     
     db_customer.updated_at = datetime.now()
+    bump_table_version(db, CUSTOMERS_TABLE)
     db.commit()
     db.refresh(db_customer)
     return db_customer
@@ -77,5 +95,6 @@ def delete_customer(
         raise HTTPException(status_code=404, detail="Customer not found")
     
     db.delete(db_customer)
+    bump_table_version(db, CUSTOMERS_TABLE)
     db.commit()
     return {"message": "Customer deleted successfully"}
\ No newline at end of file
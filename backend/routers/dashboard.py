@@ -1,12 +1,17 @@
 # routers/dashboard.py - 会社DB対応完全版
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, case, or_, and_
 from typing import Optional
 from datetime import date, datetime
 import schemas
 import company_models
+from cost_rollups import month_range
+from settings_cache import get_settings_map
 from auth_utils import get_current_user
+from company_reader import CompanyReader, get_company_reader
+from fast_json import json_response
 
 router = APIRouter(prefix="/api", tags=["ダッシュボード"])
 
@@ -20,10 +25,13 @@ def get_db(current_user = Depends(get_current_user)):
         db.close()
 
 @router.get("/dashboard")
-def get_dashboard(
-    db: Session = Depends(get_db),
+async def get_dashboard(
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    return await reader.run(_get_dashboard, current_user)
+
+def _get_dashboard(db: Session, current_user):
     # 進行中のプロジェクト数
     active_projects = db.query(company_models.Project).filter(
         company_models.Project.status == "active"
@@ -40,29 +48,27 @@ def get_dashboard(
     }
 
 @router.get("/dashboard/summary")
-def get_dashboard_summary(
+async def get_dashboard_summary(
     period_type: Optional[str] = "current",
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
-    # 期の設定を取得
-    fiscal_month_setting = db.query(company_models.SystemSettings).filter(
-        company_models.SystemSettings.key == "fiscal_year_start_month"
-    ).first()
-    
-    current_period_setting = db.query(company_models.SystemSettings).filter(
-        company_models.SystemSettings.key == "current_fiscal_period"
-    ).first()
+    summary = await reader.run(_get_dashboard_summary, current_user, period_type, start_date, end_date)
+    return json_response(summary)
+
+def _get_dashboard_summary(db: Session, current_user, period_type, start_date, end_date):
+    # 期の設定を取得（設定キャッシュから）
+    settings_map = get_settings_map(db)
+    fiscal_month_setting = settings_map.get("fiscal_year_start_month")
+    current_period_setting = settings_map.get("current_fiscal_period")
     
     fiscal_month = int(fiscal_month_setting.value) if fiscal_month_setting else 8
     current_period = int(current_period_setting.value) if current_period_setting else 1
     
     # 未請求の定義設定を取得
-    unbilled_setting = db.query(company_models.SystemSettings).filter(
-        company_models.SystemSettings.key == "unbilled_definition"
-    ).first()
+    unbilled_setting = settings_map.get("unbilled_definition")
     unbilled_type = unbilled_setting.value if unbilled_setting else "completed"
     
     # 現在の日付から期の開始・終了日を計算
@@ -94,91 +100,111 @@ def get_dashboard_summary(
         start = date(2000, 1, 1)
         end = date(2100, 12, 31)
     
-# プロジェクトの集計
-    projects_query = db.query(company_models.Project)
+    Project = company_models.Project
+    Cost = company_models.Cost
+    CostRollup = company_models.CostRollup
     
-    # 管理者以外は自分のデータのみ
+    # 対象プロジェクトの条件（管理者以外は自分のデータのみ）
+    project_filters = []
     if current_user.role != "admin":
-        projects_query = projects_query.filter(
-            company_models.Project.user_id == current_user.id
-        )
-        from sqlalchemy import or_, and_
-        projects_query = projects_query.filter(
+        project_filters.append(Project.user_id == current_user.id)
+        project_filters.append(
             or_(
-                and_(company_models.Project.start_date >= start, company_models.Project.start_date <= end),
-                and_(company_models.Project.end_date >= start, company_models.Project.end_date <= end),
-                and_(company_models.Project.start_date <= start, 
-                     or_(company_models.Project.end_date >= end, company_models.Project.end_date == None))
+                and_(Project.start_date >= start, Project.start_date <= end),
+                and_(Project.end_date >= start, Project.end_date <= end),
+                and_(Project.start_date <= start, 
+                     or_(Project.end_date >= end, Project.end_date == None))
             )
         )
     
-    projects = projects_query.all()
-    project_ids = [p.id for p in projects]
-    
-    # 原価の集計
-    costs_query = db.query(
-        func.sum(company_models.Cost.amount).label("total_cost"),
-        func.count(company_models.Cost.id).label("cost_count"),
-        company_models.Cost.category
-    ).filter(
-        company_models.Cost.project_id.in_(project_ids),
-        company_models.Cost.date >= start,
-        company_models.Cost.date <= end
-    ).group_by(company_models.Cost.category)
-    
-    costs_by_category = costs_query.all()
+    # プロジェクトの集計（受注額合計・ステータス別件数）
+    project_totals = db.query(
+        func.count(Project.id).label("total"),
+        func.sum(Project.contract_amount).label("total_contract"),
+        func.sum(case((Project.status == "active", 1), else_=0)).label("active"),
+        func.sum(case((Project.status == "completed", 1), else_=0)).label("completed")
+    ).filter(*project_filters).one()
+    
+    # 原価の集計（対象プロジェクトとJOIN）
+    months = month_range(start, end)
+    if months:
+        # 月単位の期間は月次集計テーブルから
+        costs_by_category = db.query(
+            func.sum(CostRollup.amount).label("total_cost"),
+            func.sum(CostRollup.cost_count).label("cost_count"),
+            CostRollup.category
+        ).join(
+            Project, CostRollup.project_id == Project.id
+        ).filter(
+            *project_filters,
+            CostRollup.year_month >= months[0],
+            CostRollup.year_month <= months[1]
+        ).group_by(CostRollup.category).all()
+    else:
+        costs_by_category = db.query(
+            func.sum(Cost.amount).label("total_cost"),
+            func.count(Cost.id).label("cost_count"),
+            Cost.category
+        ).join(
+            Project, Cost.project_id == Project.id
+        ).filter(
+            *project_filters,
+            Cost.date >= start,
+            Cost.date <= end
+        ).group_by(Cost.category).all()
     
     # 集計データを計算
-    total_contract = sum([p.contract_amount or 0 for p in projects])
+    total_contract = project_totals.total_contract or 0
     total_cost = sum([c.total_cost or 0 for c in costs_by_category])
     gross_profit = total_contract - total_cost
     gross_profit_rate = (gross_profit / total_contract * 100) if total_contract > 0 else 0
     
-    # カテゴリ別の内訳
+    # カテゴリ別の内訳（集計テーブルではカテゴリなしを空文字で保持）
     category_breakdown = {}
     for cost in costs_by_category:
-        category_breakdown[cost.category] = cost.total_cost or 0
-    
-    # プロジェクトのステータス別カウント
-    active_projects = len([p for p in projects if p.status == "active"])
-    completed_projects = len([p for p in projects if p.status == "completed"])
-    
-    # 未請求・未入金を計算
-    unbilled_projects = []
-    unpaid_projects = []
-    
-    for project in projects:
-        # 未請求判定
-        is_unbilled = False
-        if unbilled_type == "active" and project.status == "active" and not project.invoice_date:
-            is_unbilled = True
-        elif unbilled_type == "completed" and project.status == "completed" and not project.invoice_date:
-            is_unbilled = True
-        elif unbilled_type == "overdue" and project.end_date and project.end_date < today and not project.invoice_date:
-            is_unbilled = True
-            
-        if is_unbilled:
-            unbilled_projects.append(project)
-        
-        # 未入金判定（請求済みだが入金日なし）
-        if project.invoice_date and not project.payment_date:
-            unpaid_projects.append(project)
+        category_breakdown[cost.category or None] = cost.total_cost or 0
+    
+    # 未請求の条件
+    if unbilled_type == "active":
+        unbilled_condition = and_(Project.status == "active", Project.invoice_date == None)
+    elif unbilled_type == "completed":
+        unbilled_condition = and_(Project.status == "completed", Project.invoice_date == None)
+    elif unbilled_type == "overdue":
+        unbilled_condition = and_(Project.end_date < today, Project.invoice_date == None)
+    else:
+        unbilled_condition = None
     
-    # 未請求・未入金のプロジェクト詳細を含める
+    # 未請求のプロジェクト詳細（必要な列のみ取得）
     unbilled_details = []
-    for p in unbilled_projects:
-        unbilled_details.append({
-            "id": p.id,
-            "project_code": p.project_code,
-            "name": p.name,
-            "client_name": p.client_name,
-            "contract_amount": p.contract_amount or 0,
-            "status": p.status,
-            "end_date": p.end_date.isoformat() if p.end_date else None
-        })
+    if unbilled_condition is not None:
+        unbilled_rows = db.query(
+            Project.id, Project.project_code, Project.name, Project.client_name,
+            Project.contract_amount, Project.status, Project.end_date
+        ).filter(*project_filters, unbilled_condition).order_by(Project.id).all()
+        
+        for p in unbilled_rows:
+            unbilled_details.append({
+                "id": p.id,
+                "project_code": p.project_code,
+                "name": p.name,
+                "client_name": p.client_name,
+                "contract_amount": p.contract_amount or 0,
+                "status": p.status,
+                "end_date": p.end_date.isoformat() if p.end_date else None
+            })
+    
+    # 未入金のプロジェクト詳細（請求済みだが入金日なし）
+    unpaid_rows = db.query(
+        Project.id, Project.project_code, Project.name, Project.client_name,
+        Project.contract_amount, Project.invoice_date
+    ).filter(
+        *project_filters,
+        Project.invoice_date != None,
+        Project.payment_date == None
+    ).order_by(Project.id).all()
     
     unpaid_details = []
-    for p in unpaid_projects:
+    for p in unpaid_rows:
         unpaid_details.append({
             "id": p.id,
             "project_code": p.project_code,
@@ -188,6 +214,7 @@ def get_dashboard_summary(
             "invoice_date": p.invoice_date.isoformat() if p.invoice_date else None
         })
     
+
     return {
         "period_info": {
             "type": period_type,
@@ -203,19 +230,19 @@ def get_dashboard_summary(
             "gross_profit_rate": round(gross_profit_rate, 1)
         },
         "projects": {
-            "active": active_projects,
-            "completed": completed_projects,
-            "total": len(projects)
+            "active": project_totals.active or 0,
+            "completed": project_totals.completed or 0,
+            "total": project_totals.total
         },
         "cost_breakdown": category_breakdown,
         "unbilled": {
-            "count": len(unbilled_projects),
-            "total": sum([p.contract_amount or 0 for p in unbilled_projects]),
+            "count": len(unbilled_details),
+            "total": sum([p["contract_amount"] for p in unbilled_details]),
             "projects": unbilled_details
         },
         "unpaid": {
-            "count": len(unpaid_projects),
-            "total": sum([p.contract_amount or 0 for p in unpaid_projects]),
+            "count": len(unpaid_details),
+            "total": sum([p["contract_amount"] for p in unpaid_details]),
             "projects": unpaid_details
         },
         "period_display": f"第{current_period}期" if period_type == "current" else 
@@ -226,10 +253,13 @@ def get_dashboard_summary(
 
 # 全体統計API（管理者用）
 @router.get("/dashboard/all")
-def get_all_dashboard(
-    db: Session = Depends(get_db),
+async def get_all_dashboard(
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    return await reader.run(_get_all_dashboard, current_user)
+
+def _get_all_dashboard(db: Session, current_user):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="権限がありません")
     
@@ -255,11 +285,11 @@ def get_all_dashboard(
     # 全体の受注額を計算
     total_amount = sum(p.contract_amount or 0 for p in all_projects)
     
-    # 全プロジェクトの原価合計
-    project_ids = [p.id for p in all_projects]
-    total_cost = db.query(func.sum(company_models.Cost.amount)).filter(
-        company_models.Cost.project_id.in_(project_ids)
-    ).scalar() or 0 if project_ids else 0
+    # 全プロジェクトの原価合計（月次集計テーブルから）
+    total_cost = db.query(func.sum(company_models.CostRollup.amount)).join(
+        company_models.Project,
+        company_models.CostRollup.project_id == company_models.Project.id
+    ).scalar() or 0
     
     # 粗利益と粗利率
     gross_profit = total_amount - total_cost
@@ -277,10 +307,13 @@ def get_all_dashboard(
 
 # 自分の統計API
 @router.get("/dashboard/my")
-def get_my_dashboard(
-    db: Session = Depends(get_db),
+async def get_my_dashboard(
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    return await reader.run(_get_my_dashboard, current_user)
+
+def _get_my_dashboard(db: Session, current_user):
     # 自分のプロジェクト
     my_projects = db.query(company_models.Project).filter(
         company_models.Project.user_id == current_user.id
@@ -302,9 +335,12 @@ def get_my_dashboard(
     total_amount = sum(p.contract_amount or 0 for p in my_projects)
     
     project_ids = [p.id for p in my_projects]
-    total_cost = db.query(func.sum(company_models.Cost.amount)).filter(
-        company_models.Cost.project_id.in_(project_ids)
-    ).scalar() or 0 if project_ids else 0
+    total_cost = db.query(func.sum(company_models.CostRollup.amount)).join(
+        company_models.Project,
+        company_models.CostRollup.project_id == company_models.Project.id
+    ).filter(
+        company_models.Project.user_id == current_user.id
+    ).scalar() or 0
     
     gross_profit = total_amount - total_cost
     profit_rate = (gross_profit / total_amount * 100) if total_amount > 0 else 0
@@ -342,33 +378,54 @@ def get_my_dashboard(
 
 # ユーザー別統計API
 @router.get("/dashboard/users")
-def get_user_stats(
-    db: Session = Depends(get_db),
+async def get_user_stats(
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="権限がありません")
     
+    # master.db は同期セッションなのでスレッドプールで取得（会社DBのクエリとは分ける）
+    company_users = await run_in_threadpool(_get_company_users, current_user.company_id)
+    return await reader.run(_get_user_stats, current_user, company_users)
+
+def _get_company_users(company_id: int):
     from master_database import MasterSessionLocal, User
     master_db = MasterSessionLocal()
-    
-    company_users = master_db.query(User).filter(
-        User.company_id == current_user.company_id
-    ).all()
+    try:
+        return master_db.query(User.id, User.name).filter(
+            User.company_id == company_id
+        ).all()
+    finally:
+        master_db.close()
+
+def _get_user_stats(db: Session, current_user, company_users):
+    Project = company_models.Project
+    CostRollup = company_models.CostRollup
+    
+    # 工事ごとの原価合計（月次集計から）
+    project_costs = db.query(
+        CostRollup.project_id,
+        func.sum(CostRollup.amount).label("total_cost")
+    ).group_by(CostRollup.project_id).subquery()
+    
+    # ユーザーごとの件数・受注額・原価を1回のクエリで集計
+    rows = db.query(
+        Project.user_id,
+        func.count(Project.id).label("project_count"),
+        func.sum(Project.contract_amount).label("total_amount"),
+        func.sum(project_costs.c.total_cost).label("total_cost")
+    ).outerjoin(
+        project_costs, project_costs.c.project_id == Project.id
+    ).group_by(Project.user_id).all()
+    stats_by_user = {row.user_id: row for row in rows}
     
     user_stats = []
     for user in company_users:
-        projects = db.query(company_models.Project).filter(
-            company_models.Project.user_id == user.id
-        ).all()
-        
-        project_count = len(projects)
-        total_amount = sum(p.contract_amount or 0 for p in projects)
-        
-        project_ids = [p.id for p in projects]
-        total_cost = db.query(func.sum(company_models.Cost.amount)).filter(
-            company_models.Cost.project_id.in_(project_ids)
-        ).scalar() or 0 if project_ids else 0
+        stats = stats_by_user.get(user.id)
+        project_count = stats.project_count if stats else 0
+        total_amount = (stats.total_amount or 0) if stats else 0
+        total_cost = (stats.total_cost or 0) if stats else 0
         
         profit_rate = ((total_amount - total_cost) / total_amount * 100) if total_amount > 0 else 0
         
@@ -380,6 +437,4 @@ def get_user_stats(
             "profit_rate": profit_rate
         })
     
-    master_db.close()
-    
-    return user_stats
\ No newline at end of file
+    return user_stats
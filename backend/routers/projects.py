@@ -1,11 +1,16 @@
 # routers/projects.py - 会社DB対応完全版
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
+from typing import List, Optional, Union
+from datetime import datetime, date
 import schemas
 import company_models
+from settings_cache import get_setting, invalidate_settings
+from pagination import apply_keyset, build_page
+from export_utils import export_response, require_export_permission
 from auth_utils import get_current_user
+from company_reader import CompanyReader, get_company_reader
+from fast_json import orm_list_response, orm_page_response
 
 router = APIRouter(prefix="/api/projects", tags=["工事"])
 
@@ -18,18 +23,33 @@ def get_db(current_user = Depends(get_current_user)):
     finally:
         db.close()
 
-@router.get("", response_model=List[schemas.Project])
-def get_projects(
-    skip: int = 0, 
+@router.get("", response_model=Union[List[schemas.Project], schemas.ProjectPage])
+async def get_projects(
+    skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    """工事一覧（cursorを指定すると (created_at, id) 順のカーソル方式、cursor= で先頭ページ）"""
+    result = await reader.run(_get_projects, current_user, skip, limit, cursor)
+    if cursor is not None:
+        return orm_page_response(result, schemas.Project)
+    return orm_list_response(result, schemas.Project)
+
+def _get_projects(db: Session, current_user, skip, limit, cursor):
     # 全員が自分の工事のみ見る
-    projects = db.query(company_models.Project).filter(
+    query = db.query(company_models.Project).filter(
         company_models.Project.user_id == current_user.id
-    ).offset(skip).limit(limit).all()
+    )
+    
+    if cursor is not None:
+        rows = apply_keyset(
+            query, company_models.Project.created_at, company_models.Project.id, cursor, datetime, limit
+        ).all()
+        return build_page(rows, "created_at", limit)
     
+    projects = query.offset(skip).limit(limit).all()
     return projects
 
 
@@ -40,10 +60,8 @@ def create_project(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    # 期の設定を取得
-    settings = db.query(company_models.SystemSettings).filter(
-        company_models.SystemSettings.key == "fiscal_settings"
-    ).first()
+    # 期の設定を取得（設定キャッシュから）
+    settings = get_setting(db, "fiscal_settings")
     
     if not settings:
         # デフォルト値で作成
@@ -54,6 +72,7 @@ def create_project(
             staff_code_digits=3
         )
         db.add(settings)
+        invalidate_settings(db)
         db.commit()
         db.refresh(settings)
     
@@ -86,12 +105,70 @@ def create_project(
     db.refresh(db_project)
     return db_project
 
+# エクスポートの列
+EXPORT_PROJECT_COLUMNS = (
+    "id", "project_code", "period", "name", "client_name", "estimate_number",
+    "contract_amount", "tax_type", "tax_rate", "status", "start_date", "end_date",
+    "invoice_date", "payment_date", "notes", "user_id", "created_at", "updated_at"
+)
+
+@router.get("/export")
+def export_projects(
+    format: str = "csv",
+    period: Optional[int] = None,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    vendor: Optional[str] = None,
+    current_user = Depends(get_current_user)
+):
+    """工事のエクスポート（CSV/XLSX、期間は着工日で絞り込み、vendorはその業者の原価がある工事）
+    
+    CSVは取得しながら順に送る。XLSXは全行を一時ファイルに書き出してから送るため、
+    最初のバイトが届くのはクエリの完了後になる（大量の場合はCSVを使う）
+    """
+    require_export_permission(current_user)
+    
+    def build_query(db):
+        Project = company_models.Project
+        Cost = company_models.Cost
+        query = db.query(*[getattr(Project, name) for name in EXPORT_PROJECT_COLUMNS])
+        if current_user.role != "admin":
+            query = query.filter(Project.user_id == current_user.id)
+        if period:
+            query = query.filter(Project.period == period)
+        if status:
+            query = query.filter(Project.status == status)
+        if date_from:
+            query = query.filter(Project.start_date >= date_from)
+        if date_to:
+            query = query.filter(Project.start_date <= date_to)
+        if vendor:
+            query = query.filter(
+                db.query(Cost.id).filter(
+                    Cost.project_id == Project.id,
+                    Cost.vendor.contains(vendor)
+                ).exists()
+            )
+        return query.order_by(Project.created_at, Project.id)
+    
+    return export_response(
+        current_user.company_id,
+        build_query,
+        list(EXPORT_PROJECT_COLUMNS),
+        "projects",
+        format
+    )
+
 @router.get("/{project_id}", response_model=schemas.Project)
-def get_project(
+async def get_project(
     project_id: int,
-    db: Session = Depends(get_db),
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    return await reader.run(_get_project, current_user, project_id)
+
+def _get_project(db: Session, current_user, project_id):
     project = db.query(company_models.Project).filter(
         company_models.Project.id == project_id
     ).first()
@@ -138,13 +215,17 @@ def delete_project(
     return {"message": "Project deleted successfully"}
 
 @router.get("/by-user/{user_id}", response_model=List[schemas.Project])
-def get_projects_by_user(
+async def get_projects_by_user(
     user_id: int,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    projects = await reader.run(_get_projects_by_user, current_user, user_id, skip, limit)
+    return orm_list_response(projects, schemas.Project)
+
+def _get_projects_by_user(db: Session, current_user, user_id, skip, limit):
     # 管理者のみアクセス可能
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="管理者のみアクセス可能")
@@ -1,12 +1,14 @@
 # routers/settings.py - 会社DB対応完全版
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
 import schemas
 import company_models
+import settings_cache
 from auth_utils import get_current_user
+from etag_utils import table_etag, etag_matches, set_etag, not_modified
 
 router = APIRouter(prefix="/api/settings", tags=["設定"])
 
@@ -47,9 +49,7 @@ def get_fiscal_settings(
     current_user = Depends(get_current_user)
 ):
     """期の設定を取得"""
-    settings = db.query(company_models.SystemSettings).filter(
-        company_models.SystemSettings.key == "fiscal_settings"
-    ).first()
+    settings = settings_cache.get_setting(db, "fiscal_settings")
     
     if not settings:
         # デフォルト設定を作成
@@ -60,6 +60,7 @@ def get_fiscal_settings(
             staff_code_digits=3
         )
         db.add(settings)
+        settings_cache.invalidate_settings(db)
         db.commit()
         db.refresh(settings)
     
@@ -98,6 +99,7 @@ def update_fiscal_settings(
     settings.staff_code_digits = settings_update.staff_code_digits
     settings.updated_at = datetime.now()
     
+    settings_cache.invalidate_settings(db)
     db.commit()
     
     current_period = calculate_current_period(
@@ -129,9 +131,16 @@ def get_setting(
 
 @router.get("", response_model=List[schemas.SystemSettings])
 def get_all_settings(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
+    etag = table_etag(db, settings_cache.SETTINGS_TABLE)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
     # 会社DBから全設定を取得（権限関係なく読み取りは可能）
     settings = db.query(company_models.SystemSettings).all()
     
@@ -164,6 +173,7 @@ def update_setting(
         setting.value = update_data.value
         setting.updated_at = datetime.now()
     
+    settings_cache.invalidate_settings(db)
     db.commit()
     db.refresh(setting)
     return setting
\ No newline at end of file
@@ -1,15 +1,20 @@
 # backend/routers/super_admin.py - スーパー管理API
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import func, or_
+from typing import List, Optional
 import os
 import shutil
-from datetime import datetime
+from datetime import datetime, date
 import jwt
-from auth_utils import verify_password, create_access_token, SECRET_KEY, ALGORITHM
-from master_database import get_master_db, SuperAdmin, Company, User
+from auth_utils import verify_and_update_password, create_access_token, SECRET_KEY, ALGORITHM, invalidate_company_user_cache
+from master_database import get_master_db, SuperAdmin, Company, User, StorageUsage, StorageSample, BackupCatalog, BackupVerification
 import master_database
+import storage_accounting
+import backup_catalog
+from sqlite_backup import online_backup
+from fast_json import json_response
 from datetime import timedelta
 
 router = APIRouter(prefix="/api/super", tags=["スーパー管理"])
@@ -50,9 +55,18 @@ def super_login(
         SuperAdmin.username == username
     ).first()
     
-    if not admin or not verify_password(password, admin.password_hash):
+    if not admin:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    verified, new_hash = verify_and_update_password(password, admin.password_hash)
+    if not verified:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    # ハッシュのコストが設定と違う場合は再ハッシュして保存
+    if new_hash:
+        admin.password_hash = new_hash
+        db.commit()
+    
     # スーパー管理者用のトークン生成（通常ユーザーとは別のキーを使用）
     access_token = create_access_token({"super_admin_id": admin.id})
     
@@ -63,40 +77,66 @@ def super_login(
         "is_super_admin": True
     }
 
+# 会社一覧の並び替えに使える項目
+COMPANY_SORT_FIELDS = ("id", "name", "company_code", "plan_type", "created_at", "last_login_at", "user_count", "storage_used_mb")
+
 @router.get("/companies")
 def get_all_companies(
+    response: Response,
+    q: Optional[str] = None,
+    sort: str = "id",
+    order: str = "asc",
+    skip: int = 0,
+    limit: int = 100,
     db: Session = Depends(get_master_db),
     current_admin = Depends(get_current_super_admin)
 ):
-    """全会社一覧取得"""
-    companies = db.query(Company).all()
-    result = []
-    
-    for company in companies:
-        # DB容量計算
-        db_path = f"./data/company_{company.id}.db"
-        size_mb = 0
-        if os.path.exists(db_path):
-            size_mb = os.path.getsize(db_path) / 1024 / 1024
-        
-        # ユーザー数取得
-        user_count = db.query(User).filter(User.company_id == company.id).count()
-        
-        result.append({
+    """全会社一覧取得（q: 会社名・会社コードで絞り込み、総件数は X-Total-Count）"""
+    if sort not in COMPANY_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sortは {', '.join(COMPANY_SORT_FIELDS)} のいずれかです")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="orderは asc か desc です")
+    
+    # ユーザー数は会社ごとに1回の集計クエリで取得
+    user_counts = db.query(
+        User.company_id, func.count(User.id).label("user_count")
+    ).group_by(User.company_id).subquery()
+    user_count = func.coalesce(user_counts.c.user_count, 0)
+    # 使用容量はバックグラウンド集計の結果（storage_usage）を使う
+    storage_bytes = func.coalesce(StorageUsage.total_bytes, 0)
+    
+    query = db.query(Company, user_count, storage_bytes).outerjoin(
+        user_counts, user_counts.c.company_id == Company.id
+    ).outerjoin(StorageUsage, StorageUsage.company_id == Company.id)
+    if q:
+        query = query.filter(or_(Company.name.contains(q), Company.company_code.contains(q)))
+    
+    response.headers["X-Total-Count"] = str(query.count())
+    
+    sort_columns = {"user_count": user_count, "storage_used_mb": storage_bytes}
+    sort_column = sort_columns.get(sort, getattr(Company, sort, None))
+    if order == "desc":
+        query = query.order_by(sort_column.desc(), Company.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Company.id.asc())
+    rows = query.offset(skip).limit(limit).all()
+    
+    return [
+        {
             "id": company.id,
             "name": company.name,
             "company_code": company.company_code,
             "plan_type": company.plan_type,
-            "storage_used_mb": round(size_mb, 2),
+            "storage_used_mb": round(size_bytes / 1024 / 1024, 2),
             "storage_limit_mb": company.storage_limit_mb,
-            "user_count": user_count,
+            "user_count": count,
             "max_users": company.max_users,
             "is_active": company.is_active,
             "created_at": company.created_at,
             "last_login_at": company.last_login_at
-        })
-    
-    return result
+        }
+        for company, count, size_bytes in rows
+    ]
 
 @router.get("/companies/{company_id}/users")
 def get_company_users(
@@ -129,6 +169,7 @@ def toggle_company_active(
     
     company.is_active = not company.is_active
     db.commit()
+    invalidate_company_user_cache(company_id)
     
     return {"message": f"Company {'activated' if company.is_active else 'deactivated'}"}
 
@@ -174,8 +215,12 @@ def delete_company(
     
     db.delete(company)
     db.commit()
+    invalidate_company_user_cache(company_id)
+    
+    # 2. 会社DBファイル削除（キャッシュ中のエンジンを先に閉じる）
+    from company_database import dispose_company_engine
+    dispose_company_engine(company_id)
     
-    # 2. 会社DBファイル削除
     db_path = f"./data/company_{company_id}.db"
     if os.path.exists(db_path):
         os.remove(db_path)
@@ -184,12 +229,20 @@ def delete_company(
     backup_dir = f"./backups/company_{company_id}"
     if os.path.exists(backup_dir):
         shutil.rmtree(backup_dir)
+    db.query(BackupCatalog).filter(
+        BackupCatalog.kind == "company",
+        BackupCatalog.company_id == company_id
+    ).delete(synchronize_session=False)
+    db.commit()
+    
+    storage_accounting.request_storage_accounting()
     
     return {"message": f"Company '{company_name}' (ID: {company_id}) completely deleted"}
 
 @router.post("/companies/{company_id}/backup")
 def backup_company(
     company_id: int,
+    db: Session = Depends(get_master_db),
     current_admin = Depends(get_current_super_admin)
 ):
     """会社DBをバックアップ"""
@@ -200,16 +253,18 @@ def backup_company(
     # バックアップフォルダ作成
     os.makedirs(f"./backups/company_{company_id}", exist_ok=True)
     
-    # ファイルコピー
+    # オンラインバックアップ（稼働中でも一貫したスナップショット）
     backup_path = f"./backups/company_{company_id}/backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-    shutil.copy2(db_path, backup_path)
-    
-    # バックアップサイズ
-    size_mb = os.path.getsize(backup_path) / 1024 / 1024
+    result = online_backup(db_path, backup_path)
+    backup_catalog.record_company_backup(db, company_id, backup_path, result.bytes, result.seconds)
+    db.commit()
+    storage_accounting.request_storage_accounting()
     
     return {
         "backup_path": backup_path,
-        "size_mb": round(size_mb, 2),
+        "size_mb": round(result.bytes / 1024 / 1024, 2),
+        "bytes": result.bytes,
+        "duration_sec": result.seconds,
         "timestamp": datetime.now().isoformat()
     }
 
@@ -225,18 +280,19 @@ def get_system_stats(
     free_companies = db.query(Company).filter(Company.plan_type == "free").count()
     total_users = db.query(User).count()
     
-    # 総容量計算
-    total_size_mb = 0
-    largest_db = {"company": None, "size_mb": 0}
+    # 総容量はバックグラウンド集計の結果から計算
+    total_bytes, updated_at = db.query(
+        func.coalesce(func.sum(StorageUsage.total_bytes), 0),
+        func.max(StorageUsage.updated_at)
+    ).one()
+    total_size_mb = total_bytes / 1024 / 1024
     
-    for company in db.query(Company).all():
-        db_path = f"./data/company_{company.id}.db"
-        if os.path.exists(db_path):
-            size_mb = os.path.getsize(db_path) / 1024 / 1024
-            total_size_mb += size_mb
-            
-            if size_mb > largest_db["size_mb"]:
-                largest_db = {"company": company.name, "size_mb": size_mb}
+    largest_db = {"company": None, "size_mb": 0}
+    largest = db.query(Company.name, StorageUsage.total_bytes).join(
+        StorageUsage, StorageUsage.company_id == Company.id
+    ).order_by(StorageUsage.total_bytes.desc()).first()
+    if largest:
+        largest_db = {"company": largest.name, "size_mb": largest.total_bytes / 1024 / 1024}
     
     # マスターDBのサイズも計算
     master_db_size = 0
@@ -260,69 +316,219 @@ def get_system_stats(
             "largest_company_db": {
                 "company": largest_db["company"],
                 "size_mb": round(largest_db["size_mb"], 2)
-            }
+            },
+            "updated_at": updated_at
+        }
+    }
+
+@router.get("/db/engines")
+def get_db_engines(
+    current_admin = Depends(get_current_super_admin)
+):
+    """会社DBエンジンのキャッシュ状況（このワーカープロセス分）"""
+    from company_database import get_engine_registry_stats
+    return get_engine_registry_stats()
+
+@router.get("/db/pragmas")
+def get_db_pragmas(
+    company_id: Optional[int] = None,
+    current_admin = Depends(get_current_super_admin)
+):
+    """SQLiteのPRAGMA設定（設定値と実際の値）"""
+    from config import SQLITE_PROFILE
+    from sqlite_pragmas import get_pragma_profile, read_sqlite_pragmas
+    
+    result = {
+        "profile": SQLITE_PROFILE,
+        "master": {
+            "configured": get_pragma_profile("master"),
+            "effective": read_sqlite_pragmas(master_database.master_engine)
         }
     }
+    
+    if company_id is not None:
+        from company_database import get_company_engine, get_company_db_path
+        if not os.path.exists(get_company_db_path(company_id)):
+            raise HTTPException(status_code=404, detail="Company DB not found")
+        result["company"] = {
+            "company_id": company_id,
+            "configured": get_pragma_profile("company"),
+            "effective": read_sqlite_pragmas(get_company_engine(company_id))
+        }
+    
+    return result
+
+@router.get("/companies/{company_id}/storage")
+def get_company_storage(
+    company_id: int,
+    days: int = 30,
+    db: Session = Depends(get_master_db),
+    current_admin = Depends(get_current_super_admin)
+):
+    """会社の使用容量と、指定日数分の推移"""
+    company = db.query(Company).filter(Company.id == company_id).first()
+    if not company:
+        raise HTTPException(status_code=404, detail="Company not found")
+    
+    usage = db.query(StorageUsage).filter(StorageUsage.company_id == company_id).first()
+    since = datetime.now() - timedelta(days=days)
+    
+    # 期間の開始時点の値（期間より前の最後の記録）も含めて増加量を計算
+    baseline = db.query(StorageSample).filter(
+        StorageSample.company_id == company_id,
+        StorageSample.sampled_at < since
+    ).order_by(StorageSample.sampled_at.desc()).first()
+    samples = db.query(StorageSample).filter(
+        StorageSample.company_id == company_id,
+        StorageSample.sampled_at >= since
+    ).order_by(StorageSample.sampled_at).all()
+    
+    current_bytes = usage.total_bytes if usage else 0
+    start_sample = baseline or (samples[0] if samples else None)
+    growth_bytes = current_bytes - start_sample.total_bytes if start_sample else 0
+    
+    return {
+        "company_id": company_id,
+        "storage_limit_mb": company.storage_limit_mb,
+        "current": {
+            "db_bytes": usage.db_bytes if usage else 0,
+            "wal_bytes": usage.wal_bytes if usage else 0,
+            "backup_bytes": usage.backup_bytes if usage else 0,
+            "total_bytes": current_bytes,
+            "updated_at": usage.updated_at if usage else None
+        },
+        "days": days,
+        "growth_bytes": growth_bytes,
+        "growth_mb_per_day": round(growth_bytes / 1024 / 1024 / days, 3) if days > 0 else None,
+        "samples": [
+            {
+                "sampled_at": sample.sampled_at,
+                "db_bytes": sample.db_bytes,
+                "wal_bytes": sample.wal_bytes,
+                "backup_bytes": sample.backup_bytes,
+                "total_bytes": sample.total_bytes
+            }
+            for sample in samples
+        ]
+    }
+
+@router.get("/metrics/storage-accounting")
+def get_storage_accounting_metrics(
+    current_admin = Depends(get_current_super_admin)
+):
+    """使用容量の集計状態（このワーカー分）"""
+    return storage_accounting.get_storage_accounting_status()
+
+@router.get("/metrics/password-hash")
+def get_password_hash_metrics(
+    current_admin = Depends(get_current_super_admin)
+):
+    """パスワードハッシュ用プールの待ち時間など（このワーカープロセス分）"""
+    from auth_utils import get_password_hash_stats
+    return get_password_hash_stats()
 
 # backend/routers/super_admin.py に追加
 
 @router.get("/backups")
 def get_all_backups(
+    response: Response,
+    company_id: Optional[int] = None,
+    kind: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    skip: int = 0,
+    limit: int = 100,
     db: Session = Depends(get_master_db),
     current_admin = Depends(get_current_super_admin)
 ):
-    """全バックアップ一覧取得"""
-    backups = []
-    
-    # backupsフォルダを探索
-    backup_base = "./backups"
-    if os.path.exists(backup_base):
-        for company_folder in os.listdir(backup_base):
-            if company_folder.startswith("company_"):
-                company_id = int(company_folder.split("_")[1])
-                company_path = os.path.join(backup_base, company_folder)
-                
-                # 会社名を取得
-                company = db.query(Company).filter(Company.id == company_id).first()
-                company_name = company.name if company else f"削除済み会社 (ID: {company_id})"
-                
-                # バックアップファイル一覧
-                for backup_file in os.listdir(company_path):
-                    if backup_file.endswith(".db"):
-                        file_path = os.path.join(company_path, backup_file)
-                        file_stats = os.stat(file_path)
-                        
-                        backups.append({
-                            "company_id": company_id,
-                            "company_name": company_name,
-                            "filename": backup_file,
-                            "size_mb": round(file_stats.st_size / 1024 / 1024, 2),
-                            "created_at": datetime.fromtimestamp(file_stats.st_ctime).isoformat(),
-                            "path": file_path
-                        })
+    """全バックアップ一覧取得（バックアップ一覧テーブルを検索、総件数は X-Total-Count）"""
+    # 最新の検証結果（scripts/verify_backups.py）
+    latest_verification = db.query(
+        BackupVerification.catalog_id, func.max(BackupVerification.id).label("id")
+    ).group_by(BackupVerification.catalog_id).subquery()
+    
+    query = db.query(BackupCatalog, Company.name, BackupVerification).outerjoin(
+        Company, Company.id == BackupCatalog.company_id
+    ).outerjoin(
+        latest_verification, latest_verification.c.catalog_id == BackupCatalog.id
+    ).outerjoin(
+        BackupVerification, BackupVerification.id == latest_verification.c.id
+    )
+    if company_id is not None:
+        query = query.filter(BackupCatalog.company_id == company_id)
+    if kind:
+        query = query.filter(BackupCatalog.kind == kind)
+    if date_from:
+        query = query.filter(BackupCatalog.created_at >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        query = query.filter(BackupCatalog.created_at < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    
+    response.headers["X-Total-Count"] = str(query.count())
     
     # 作成日時でソート（新しい順）
-    backups.sort(key=lambda x: x["created_at"], reverse=True)
-    return backups
+    rows = query.order_by(
+        BackupCatalog.created_at.desc(), BackupCatalog.id.desc()
+    ).offset(skip).limit(limit).all()
+    
+    return json_response([
+        {
+            "id": backup.id,
+            "kind": backup.kind,
+            "company_id": backup.company_id,
+            "company_name": company_name or (
+                f"削除済み会社 (ID: {backup.company_id})" if backup.company_id else "マスターDB"
+            ),
+            "filename": backup.filename,
+            "file_name": backup.filename,  # 管理画面（SuperAdminDashboard）が参照する名前
+            "size_mb": round(backup.size_bytes / 1024 / 1024, 2),
+            "duration_sec": backup.duration_sec,
+            "created_at": backup.created_at.isoformat(),
+            "path": backup.location,
+            "verified": {
+                "ok": verification.ok,
+                "verified_at": verification.verified_at.isoformat(),
+                "check_type": verification.check_type,
+                "duration_sec": verification.duration_sec,
+                "detail": verification.detail
+            } if verification else None
+        }
+        for backup, company_name, verification in rows
+    ], response)
+
+@router.post("/backups/rescan")
+def rescan_backup_catalog(
+    db: Session = Depends(get_master_db),
+    current_admin = Depends(get_current_super_admin)
+):
+    """backupsフォルダを走査してバックアップ一覧を実ファイルと揃える"""
+    added, removed = backup_catalog.rescan_backups(db)
+    return {"added": added, "removed": removed}
 
 @router.delete("/backups/{company_id}/{filename}")
 def delete_backup(
     company_id: int,
     filename: str,
+    db: Session = Depends(get_master_db),
     current_admin = Depends(get_current_super_admin)
 ):
     """バックアップファイルを削除"""
     backup_path = f"./backups/company_{company_id}/{filename}"
     
-    if not os.path.exists(backup_path):
+    if os.path.basename(filename) != filename or not os.path.exists(backup_path):
         raise HTTPException(status_code=404, detail="Backup file not found")
     
     os.remove(backup_path)
+    backup_catalog.remove_location(db, backup_path)
+    db.commit()
     
     # フォルダが空になったら削除
     folder_path = f"./backups/company_{company_id}"
     if os.path.exists(folder_path) and not os.listdir(folder_path):
         os.rmdir(folder_path)
+    
+    storage_accounting.request_storage_accounting()
+    
+    return {"message": "Backup deleted successfully"}
 
 # backend/routers/super_admin.py に追加
 
@@ -403,11 +609,9 @@ def create_custom_company(
     db.commit()
     db.refresh(company)
     
-    # 会社DB初期化
+    # 会社DB初期化（エンジン作成時にスキーマを作成）
     from company_database import get_company_engine
-    from company_models import CompanyBase
-    engine = get_company_engine(company.id)
-    CompanyBase.metadata.create_all(bind=engine)
+    get_company_engine(company.id)
     
     # 管理者ユーザー作成
     admin_user = User(
@@ -2,9 +2,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Dict, Optional
-from auth_utils import get_current_user
+from auth_utils import get_current_user, get_password_hash, invalidate_user_cache
 from master_database import MasterSessionLocal, User
-import bcrypt
 
 router = APIRouter(prefix="/api", tags=["ユーザー管理"])
 
@@ -90,14 +89,14 @@ def create_user(
             if existing_staff:
                 raise HTTPException(status_code=400, detail=f"担当者番号 '{user_data.staff_code}' は既に使用されています")
         
-        # パスワードをハッシュ化
-        hashed = bcrypt.hashpw(user_data.password.encode('utf-8'), bcrypt.gensalt())
+        # パスワードをハッシュ化（ハッシュ専用プールで実行）
+        hashed = get_password_hash(user_data.password)
         
         # ユーザー作成
         new_user = User(
             username=user_data.username,
             name=user_data.name,
-            password_hash=hashed.decode('utf-8'),
+            password_hash=hashed,
             company_id=current_user.company_id,
             staff_code=user_data.staff_code,
             permissions=user_data.permissions,
@@ -150,10 +149,10 @@ def update_user(
         if user_data.is_active is not None:
             user.is_active = user_data.is_active
         if user_data.password is not None:
-            hashed = bcrypt.hashpw(user_data.password.encode('utf-8'), bcrypt.gensalt())
-            user.password_hash = hashed.decode('utf-8')
+            user.password_hash = get_password_hash(user_data.password)
         
         db.commit()
+        invalidate_user_cache(user_id)
         return {"message": "ユーザー情報を更新しました"}
     finally:
         db.close()
@@ -181,6 +180,7 @@ def delete_user(
         
         db.delete(user)
         db.commit()
+        invalidate_user_cache(user_id)
         return {"message": "削除しました"}
     finally:
         db.close()
\ No newline at end of file
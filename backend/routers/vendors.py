@@ -1,13 +1,19 @@
 # routers/vendors.py - 会社DB対応完全版
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from typing import List
 import schemas
 import company_models
 from auth_utils import get_current_user
+from company_reader import CompanyReader, get_company_reader
+from table_versions import bump_table_version
+from etag_utils import table_etag, etag_matches, set_etag, not_modified
 
 router = APIRouter(prefix="/api/vendors", tags=["業者"])
 
+# 一覧のETag用（書き込み時にバージョンを上げる）
+VENDORS_TABLE = "vendors"
+
 def get_db(current_user = Depends(get_current_user)):
     """会社DBを取得"""
     from company_database import get_company_session
@@ -18,10 +24,20 @@ def get_db(current_user = Depends(get_current_user)):
         db.close()
 
 @router.get("", response_model=List[schemas.Vendor])
-def get_vendors(
-    db: Session = Depends(get_db),
+async def get_vendors(
+    request: Request,
+    response: Response,
+    reader: CompanyReader = Depends(get_company_reader),
     current_user = Depends(get_current_user)
 ):
+    return await reader.run(_get_vendors, current_user, request.headers.get("If-None-Match"), response)
+
+def _get_vendors(db: Session, current_user, if_none_match, response):
+    etag = table_etag(db, VENDORS_TABLE)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
     vendors = db.query(company_models.Vendor).filter(
         company_models.Vendor.is_active == True
     ).all()
@@ -35,6 +51,7 @@ def create_vendor(
 ):
     db_vendor = company_models.Vendor(**vendor.dict())
     db.add(db_vendor)
+    bump_table_version(db, VENDORS_TABLE)
     db.commit()
     db.refresh(db_vendor)
     return db_vendor
@@ -57,6 +74,7 @@ def update_vendor(
     for key, value in update_data.items():
         setattr(db_vendor, key, value)
     
+    bump_table_version(db, VENDORS_TABLE)
     db.commit()
     db.refresh(db_vendor)
     return db_vendor
@@ -75,5 +93,6 @@ def delete_vendor(
         raise HTTPException(status_code=404, detail="Vendor not found")
     
     db.delete(db_vendor)
+    bump_table_version(db, VENDORS_TABLE)
     db.commit()
     return {"message": "Vendor deleted successfully"}
\ No newline at end of file
@@ -1,6 +1,7 @@
 # backend/schemas.py - 完全版（username統一版）
 from pydantic import BaseModel
 from datetime import date, datetime
+import datetime as dt
 from typing import Optional, List
 
 # === 認証・会社関連スキーマ ===
@@ -98,6 +99,11 @@ class Project(ProjectBase):
     class Config:
         orm_mode = True
 
+# カーソル方式のページ（next_cursorがNoneなら最後のページ）
+class ProjectPage(BaseModel):
+    items: List[Project]
+    next_cursor: Optional[str] = None
+
 # 原価関連スキーマ
 class CostBase(BaseModel):
     project_id: int
@@ -117,7 +123,7 @@ class CostCreate(CostBase):
 
 class CostUpdate(CostBase):
     project_id: Optional[int] = None
-    date: Optional[date] = None
+    date: Optional[dt.date] = None  # 項目名 date が型名を隠すためモジュール経由で指定
     vendor: Optional[str] = None
     amount: Optional[int] = None
     total_amount: Optional[int] = None
@@ -130,6 +136,18 @@ class Cost(CostBase):
     class Config:
         orm_mode = True
 
+class CostPage(BaseModel):
+    items: List[Cost]
+    next_cursor: Optional[str] = None
+
+class CostBatchOperation(BaseModel):
+    op: str                      # create / update / delete
+    id: Optional[int] = None     # update・delete で指定
+    data: Optional[dict] = None  # create は CostCreate、update は CostUpdate の項目
+
+class CostBatch(BaseModel):
+    operations: List[CostBatchOperation]
+
 # 業者関連スキーマ
 class VendorBase(BaseModel):
     name: str
@@ -2,13 +2,31 @@
 """
 DBバックアップスクリプト
 毎日深夜3時に自動実行（cronで設定）
+稼働中のDBからsqlite3のオンラインバックアップで取得するため、サービス停止は不要
+バックアップ先はチャンクストア（chunk_store.py）で、前回から変わった部分だけを書き込む
 """
 import os
+import argparse
+import glob
 import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta
 import sys
 import system_config as config
 from send_email import send_alert_email
+from sqlite_backup import online_backup
+import chunk_store
+import backup_catalog
+from sqlalchemy import create_engine
+from sqlite_pragmas import apply_sqlite_pragmas
+from master_database import MasterSessionLocal
+
+# master.db はアプリのフォルダの絶対パスで開く（関数を直接呼んだ場合もカレントディレクトリに関係なく同じDBを更新）
+_master_engine = apply_sqlite_pragmas(
+    create_engine(f"sqlite:///{os.path.join(config.APP_DIR, 'master.db')}"), "master"
+)
 
 def log_info(message):
     """情報ログ出力"""
@@ -44,49 +62,60 @@ def backup_database():
             )
             return False
     
-    # タイムスタンプ付きバックアップフォルダ作成
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_path = os.path.join(config.BACKUP_DIR, f"backup_{timestamp}")
+    # スナップショット名（マニフェストのファイル名）
+    snapshot_name = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    log_info(f"バックアップ先: {config.BACKUP_DIR}（スナップショット: {snapshot_name}）")
+    
+    started = time.monotonic()
+    
+    # master.dbをバックアップ（WALの内容も含めた一貫したスナップショット）
+    master_db = os.path.join(config.APP_DIR, "master.db")
+    if not os.path.exists(master_db):
+        log_error("master.dbが見つかりません")
+        return False
+    targets = [(master_db, "master.db")]
+    
+    # 会社DBをバックアップ
+    data_dir = os.path.join(config.APP_DIR, "data")
+    if os.path.exists(data_dir):
+        targets.extend(
+            (db_path, f"data/{os.path.basename(db_path)}")
+            for db_path in sorted(glob.glob(os.path.join(data_dir, "company_*.db")))
+        )
+    else:
+        log_warning("dataフォルダが見つかりません（会社がまだ作成されていない可能性）")
     
-    log_info(f"バックアップ先: {backup_path}")
-    os.makedirs(backup_path, exist_ok=True)
+    codec = chunk_store.resolve_codec(config.BACKUP_COMPRESSION)
+    limiter = chunk_store.RateLimiter(config.BACKUP_IO_RATE_MB)
+    log_info(
+        f"{len(targets)}個のDBをバックアップ中..."
+        f"（並列数 {config.BACKUP_SNAPSHOT_WORKERS}、圧縮 {codec}）"
+    )
     
     try:
-        # master.dbをバックアップ
-        master_db = os.path.join(config.APP_DIR, "master.db")
-        if os.path.exists(master_db):
-            log_info("master.dbをバックアップ中...")
-            shutil.copy2(master_db, backup_path)
+        # チャンクの書き込みからマニフェストの保存まではロックを持ち、未参照チャンクの削除と重ならないようにする
+        with chunk_store.store_lock(config.BACKUP_DIR):
+            # 稼働中のDBからローカルの一時ファイルにスナップショットを取り、
+            # チャンクストアには前回から変わったチャンクだけを圧縮して書き込む
+            with tempfile.TemporaryDirectory(dir=config.BACKUP_TEMP_DIR) as tmp_dir, \
+                    ProcessPoolExecutor(max_workers=config.BACKUP_COMPRESS_WORKERS) as compress_pool, \
+                    ThreadPoolExecutor(max_workers=config.BACKUP_SNAPSHOT_WORKERS) as snapshot_pool:
+                futures = [
+                    snapshot_pool.submit(backup_file, db_path, name, tmp_dir, codec, compress_pool, limiter)
+                    for db_path, name in targets
+                ]
+                # マニフェストの並びは対象の順（master.db が先頭）
+                files = [future.result() for future in futures]
             
-            # WALファイルもバックアップ
-            wal_file = f"{master_db}-wal"
-            shm_file = f"{master_db}-shm"
-            
-            if os.path.exists(wal_file):
-                shutil.copy2(wal_file, backup_path)
-            if os.path.exists(shm_file):
-                shutil.copy2(shm_file, backup_path)
-        else:
-            log_error("master.dbが見つかりません")
-            return False
-        
-        # dataフォルダをバックアップ
-        data_dir = os.path.join(config.APP_DIR, "data")
-        if os.path.exists(data_dir):
-            log_info("dataフォルダをバックアップ中...")
-            shutil.copytree(data_dir, os.path.join(backup_path, "data"))
-        else:
-            log_warning("dataフォルダが見つかりません（会社がまだ作成されていない可能性）")
-        
-        # バックアップサイズを計算
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(backup_path):
-            for filename in filenames:
-                filepath = os.path.join(dirpath, filename)
-                total_size += os.path.getsize(filepath)
+            # 全チャンクを書き込んでからマニフェストを作成（途中で失敗したスナップショットは残らない）
+            duration = round(time.monotonic() - started, 3)
+            manifest = chunk_store.write_manifest(config.BACKUP_DIR, snapshot_name, files, duration, codec)
+        update_catalog(added=(chunk_store.snapshot_path(config.BACKUP_DIR, snapshot_name), manifest))
         
-        size_mb = total_size / (1024 * 1024)
-        log_info(f"バックアップ完了: {size_mb:.2f}MB")
+        log_info(
+            f"バックアップ完了: {manifest['total_bytes'] / (1024 * 1024):.2f}MB"
+            f"（新規 {manifest['new_bytes'] / (1024 * 1024):.2f}MB → 圧縮後 {manifest['stored_bytes'] / (1024 * 1024):.2f}MB、{duration}秒）"
+        )
         
         # 古いバックアップを削除
         cleanup_old_backups()
@@ -102,14 +131,66 @@ def backup_database():
         )
         return False
 
+def backup_file(db_path, name, tmp_dir, codec, compress_pool, limiter):
+    """DBのスナップショットを取り、変更のあったチャンクだけをチャンクストアに保存（スレッドで実行）"""
+    started = time.monotonic()
+    snapshot = online_backup(db_path, os.path.join(tmp_dir, os.path.basename(db_path)))
+    try:
+        entry = chunk_store.store_file(
+            config.BACKUP_DIR, snapshot.path, name, config.BACKUP_CHUNK_SIZE,
+            codec=codec, pool=compress_pool, pool_workers=config.BACKUP_COMPRESS_WORKERS, limiter=limiter
+        )
+    finally:
+        os.remove(snapshot.path)
+    entry["snapshot_sec"] = snapshot.seconds
+    entry["duration_sec"] = round(time.monotonic() - started, 3)
+    log_info(
+        f"  {name}: {entry['bytes'] / 1024 / 1024:.2f}MB"
+        f"（新規 {entry['new_chunks']}チャンク / 圧縮後 {entry['stored_bytes'] / 1024 / 1024:.2f}MB、{entry['duration_sec']}秒）"
+    )
+    return entry
+
+def update_catalog(added=None, removed=()):
+    """master.db のバックアップ一覧を更新（失敗してもバックアップ自体は続行）"""
+    db = MasterSessionLocal(bind=_master_engine)
+    try:
+        if added:
+            manifest_path, manifest = added
+            backup_catalog.record_snapshot(db, manifest_path, manifest)
+        for manifest_path in removed:
+            backup_catalog.remove_location(db, manifest_path)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        log_warning(f"バックアップ一覧の更新に失敗: {e}")
+    finally:
+        db.close()
+
 def cleanup_old_backups():
-    """古いバックアップを削除"""
+    """古いバックアップを削除し、どのスナップショットからも参照されないチャンクを削除（成功したらTrue）"""
     log_info(f"古いバックアップを削除中（{config.BACKUP_RETENTION_DAYS}日以前）...")
     
     cutoff_date = datetime.now() - timedelta(days=config.BACKUP_RETENTION_DAYS)
     deleted_count = 0
     
     try:
+        # スナップショット（マニフェスト）と未参照チャンクの削除は、別プロセスのバックアップと排他で行う
+        with chunk_store.store_lock(config.BACKUP_DIR):
+            snapshots = chunk_store.list_snapshots(config.BACKUP_DIR)
+            expired = []
+            for name, manifest_path, created_at in snapshots:
+                if created_at < cutoff_date:
+                    log_info(f"削除: {name}")
+                    os.remove(manifest_path)
+                    expired.append(manifest_path)
+                    deleted_count += 1
+            update_catalog(removed=expired)
+            
+            # 参照されなくなったチャンクを削除
+            chunk_count, chunk_bytes = chunk_store.collect_garbage(config.BACKUP_DIR)
+        log_info(f"未参照チャンクの削除: {chunk_count}個（{chunk_bytes / 1024 / 1024:.2f}MB）")
+        
+        # 以前の形式（backup_* フォルダにファイルをそのままコピー）
         for item in os.listdir(config.BACKUP_DIR):
             if not item.startswith("backup_"):
                 continue
@@ -127,15 +208,29 @@ def cleanup_old_backups():
                 deleted_count += 1
         
         # 現在のバックアップ数を確認
-        backup_count = len([d for d in os.listdir(config.BACKUP_DIR) if d.startswith("backup_")])
+        backup_count = len(chunk_store.list_snapshots(config.BACKUP_DIR)) + len([
+            d for d in os.listdir(config.BACKUP_DIR)
+            if d.startswith("backup_") and os.path.isdir(os.path.join(config.BACKUP_DIR, d))
+        ])
         log_info(f"削除数: {deleted_count}, 現在のバックアップ数: {backup_count}")
+        return True
         
     except Exception as e:
         log_error(f"古いバックアップの削除中にエラー: {e}")
+        return False
 
 def main():
     """メイン処理"""
-    success = backup_database()
+    parser = argparse.ArgumentParser(description="ECM バックアップツール")
+    parser.add_argument("--cleanup", action="store_true", help="バックアップは取らず、古いバックアップと未参照チャンクの削除だけ行う")
+    args = parser.parse_args()
+    
+    # data/ などアプリと同じ相対パスで扱うため、アプリのフォルダで実行
+    os.chdir(config.APP_DIR)
+    if args.cleanup:
+        success = cleanup_old_backups()
+    else:
+        success = backup_database()
     
     if success:
         sys.exit(0)  # 正常終了
@@ -0,0 +1,110 @@
+# backend/scripts/bench_serialization.py
+"""
+一覧レスポンスのシリアライズ性能の比較
+
+原価一覧（/api/costs）と同じ形のデータを作り、次の方式のCPU時間とサイズを測る
+  response_model: ORMからスキーマへの検証 + JSON化（FAST_JSON_RESPONSES=false の経路）
+  jsonable_encoder: 旧来の FastAPI と同じ jsonable_encoder + json.dumps
+  fast_json: スキーマの項目だけの dict + orjson（FAST_JSON_RESPONSES=true の経路）
+あわせて gzip / brotli（インストール時）で圧縮した場合のサイズと時間も表示する
+"""
+import argparse
+import gzip
+import json
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+import system_config  # noqa: F401  backend をインポートパスに追加
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from config import COMPRESSION_GZIP_LEVEL
+import company_models
+import schemas
+import fast_json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def build_costs(count):
+    """DBに保存せずに原価のORMオブジェクトを作成"""
+    now = datetime.now()
+    return [
+        company_models.Cost(
+            id=i + 1,
+            project_id=i % 50 + 1,
+            date=date(2026, 1, 1) + timedelta(days=i % 365),
+            vendor=f"業者{i % 200}",
+            description=f"資材購入 {i}",
+            amount=10000 + i,
+            tax_type="included",
+            tax_amount=1000,
+            total_amount=11000 + i,
+            category="材料費",
+            payment_status="unpaid",
+            payment_date=None,
+            created_at=now,
+            updated_at=now
+        )
+        for i in range(count)
+    ]
+
+def _cpu_time(fn, repeat):
+    """最も速かった1回のCPU時間（秒）と結果"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.process_time()
+        result = fn()
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="ECM シリアライズ性能の比較")
+    parser.add_argument("--rows", type=int, default=5000, help="原価の件数")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数（最速の値を表示）")
+    args = parser.parse_args()
+
+    rows = build_costs(args.rows)
+    adapter = TypeAdapter(List[schemas.Cost])
+
+    methods = {
+        "response_model": lambda: adapter.dump_json(adapter.validate_python(rows, from_attributes=True)),
+        "jsonable_encoder": lambda: json.dumps(
+            jsonable_encoder(adapter.validate_python(rows, from_attributes=True)), ensure_ascii=False
+        ).encode("utf-8"),
+    }
+    if fast_json.orjson is not None:
+        methods["fast_json"] = lambda: fast_json.FastJSONResponse(fast_json.orm_rows(rows, schemas.Cost)).body
+    else:
+        print("⚠️ orjson がインストールされていないため fast_json は測定しません")
+
+    print(f"原価 {args.rows} 件（{args.repeat}回中の最速、CPU時間）")
+    baseline = None
+    body = None
+    for name, fn in methods.items():
+        seconds, body = _cpu_time(fn, args.repeat)
+        baseline = baseline or seconds
+        print(f"  {name:<17} {seconds * 1000:8.1f} ms  x{baseline / seconds:4.1f}  {len(body) / 1024:8.1f} KB")
+
+    print("圧縮（最後の方式の出力）")
+    compressors = {
+        "gzip(9)": lambda: gzip.compress(body, compresslevel=9),
+        f"gzip({COMPRESSION_GZIP_LEVEL})": lambda: gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL),
+    }
+    if brotli is not None:
+        compressors["brotli"] = lambda: brotli.compress(body, quality=4)
+    for name, fn in compressors.items():
+        seconds, compressed = _cpu_time(fn, args.repeat)
+        print(f"  {name:<17} {seconds * 1000:8.1f} ms  {len(compressed) / 1024:8.1f} KB "
+              f"({len(compressed) / len(body) * 100:.1f}%)")
+
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
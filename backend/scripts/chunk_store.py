@@ -0,0 +1,300 @@
+# backend/scripts/chunk_store.py
+"""
+重複排除バックアップ用のチャンクストア
+
+BACKUP_DIR/
+  chunks/ab/abcdef...   内容のSHA-256を名前にしたチャンク（同じ内容は1つだけ保存）
+  snapshots/backup_YYYYMMDD_HHMMSS.json   スナップショットのマニフェスト
+  .lock                 書き込み（スナップショット）と未参照チャンクの削除を排他するロックファイル
+
+DBファイルを固定長のチャンクに分割し、まだ保存されていないチャンクだけを書き込む。
+SQLiteはページ単位で更新されるため、変更のない部分は前回までのチャンクを共有する。
+チャンクは圧縮して保存する（zstd: zstandardがあれば / gzip）。名前は圧縮前の内容のハッシュ
+"""
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNKS_DIR = "chunks"
+SNAPSHOTS_DIR = "snapshots"
+SNAPSHOT_PREFIX = "backup_"
+LOCK_FILE = ".lock"
+
+# 圧縮方式 -> チャンクファイルの拡張子（"none" は圧縮なし）
+CODEC_EXTENSIONS = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+
+def resolve_codec(codec):
+    """使用する圧縮方式（zstandard未インストールならgzip）"""
+    if codec not in CODEC_EXTENSIONS:
+        raise ValueError(f"未対応の圧縮方式: {codec}")
+    if codec == "zstd" and zstandard is None:
+        return "gzip"
+    return codec
+
+def compress_chunk(codec, data):
+    """チャンクを圧縮（ワーカープロセスで実行）"""
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+def decompress_chunk(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd圧縮のチャンクの復元には zstandard のインストールが必要です")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    return data
+
+class RateLimiter:
+    """書き込み速度の上限（MB/秒、0以下で無制限）、スレッド間で共有"""
+
+    def __init__(self, mb_per_sec):
+        self.bytes_per_sec = mb_per_sec * 1024 * 1024
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def consume(self, size):
+        if self.bytes_per_sec <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + size / self.bytes_per_sec
+        if start > now:
+            time.sleep(start - now)
+
+@contextmanager
+def store_lock(backup_dir):
+    """チャンクストアの排他ロック（別プロセスのバックアップ・削除が終わるまで待つ）
+
+    チャンクを書いてからマニフェストを保存するまでの間は、新しいチャンクがどのマニフェストからも
+    参照されていないため、その間に collect_garbage が動くと削除されてしまう。両方をこのロックの中で行う
+    """
+    with open(os.path.join(backup_dir, LOCK_FILE), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def chunk_path(backup_dir, digest, codec="none"):
+    """チャンクの保存先（先頭2文字でフォルダを分ける）"""
+    return os.path.join(backup_dir, CHUNKS_DIR, digest[:2], digest + CODEC_EXTENSIONS[codec])
+
+def find_chunk(backup_dir, digest):
+    """保存済みのチャンク (パス, 圧縮方式)、なければ None"""
+    for codec in CODEC_EXTENSIONS:
+        path = chunk_path(backup_dir, digest, codec)
+        if os.path.exists(path):
+            return path, codec
+    return None
+
+def _write_chunk(backup_dir, digest, codec, data, limiter=None):
+    """圧縮済みのチャンクを保存、書いたバイト数を返す"""
+    if limiter is not None:
+        limiter.consume(len(data))
+    path = chunk_path(backup_dir, digest, codec)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 並行して同じチャンクを書くことがあるため一時ファイル名は書き込み元ごとに分ける
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+def store_file(backup_dir, src_path, name, chunk_size, codec="none", pool=None, pool_workers=1, limiter=None):
+    """ファイルをチャンクに分けて保存し、マニフェスト用のエントリを返す
+
+    未保存のチャンクだけを圧縮して書き込む。pool（ProcessPoolExecutor）があれば
+    圧縮はワーカープロセスで行い、同時に処理中のチャンク数は pool_workers の2倍までにする
+    """
+    file_hash = hashlib.sha256()
+    chunks = []
+    new_chunks = 0
+    new_bytes = 0
+    stored_bytes = 0
+    size = 0
+    pending = []       # (digest, 圧縮結果のFuture)
+    queued = set()     # このファイル内で書き込み予定のチャンク
+    max_pending = pool_workers * 2
+
+    def write_pending(limit):
+        nonlocal new_chunks, stored_bytes
+        while len(pending) > limit:
+            digest, future = pending.pop(0)
+            stored_bytes += _write_chunk(backup_dir, digest, codec, future.result(), limiter)
+            new_chunks += 1
+
+    with open(src_path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            digest = hashlib.sha256(data).hexdigest()
+            file_hash.update(data)
+            chunks.append(digest)
+            size += len(data)
+
+            if digest in queued or find_chunk(backup_dir, digest):
+                continue
+            queued.add(digest)
+            new_bytes += len(data)
+
+            if pool is None:
+                stored_bytes += _write_chunk(backup_dir, digest, codec, compress_chunk(codec, data), limiter)
+                new_chunks += 1
+            else:
+                pending.append((digest, pool.submit(compress_chunk, codec, data)))
+                write_pending(max_pending)
+
+    write_pending(0)
+
+    return {
+        "path": name,
+        "bytes": size,
+        "sha256": file_hash.hexdigest(),
+        "chunks": chunks,
+        "new_chunks": new_chunks,
+        "new_bytes": new_bytes,
+        "stored_bytes": stored_bytes
+    }
+
+def restore_file(backup_dir, entry, dest_path):
+    """マニフェストのエントリからファイルを組み立てる（チェックサムを確認してから置き換え）"""
+    os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+    tmp_path = f"{dest_path}.restore"
+    file_hash = hashlib.sha256()
+
+    try:
+        with open(tmp_path, "wb") as out:
+            for digest in entry["chunks"]:
+                found = find_chunk(backup_dir, digest)
+                if found is None:
+                    raise FileNotFoundError(f"チャンクが見つかりません: {digest}")
+                path, codec = found
+                with open(path, "rb") as f:
+                    data = decompress_chunk(codec, f.read())
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise ValueError(f"チャンクが破損しています: {digest}")
+                file_hash.update(data)
+                out.write(data)
+        if file_hash.hexdigest() != entry["sha256"]:
+            raise ValueError(f"チェックサムが一致しません: {entry['path']}")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, dest_path)
+
+def snapshot_path(backup_dir, snapshot_name):
+    return os.path.join(backup_dir, SNAPSHOTS_DIR, f"{snapshot_name}.json")
+
+def write_manifest(backup_dir, snapshot_name, files, duration, codec="none"):
+    """スナップショットのマニフェストを保存（全チャンクの書き込み後に作成）"""
+    manifest = {
+        "snapshot": snapshot_name,
+        "created_at": datetime.now().isoformat(),
+        "duration_sec": duration,
+        "codec": codec,
+        "total_bytes": sum(entry["bytes"] for entry in files),
+        "new_bytes": sum(entry["new_bytes"] for entry in files),
+        "stored_bytes": sum(entry.get("stored_bytes", entry["new_bytes"]) for entry in files),
+        "files": files
+    }
+    path = snapshot_path(backup_dir, snapshot_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return manifest
+
+def load_manifest(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def list_snapshots(backup_dir):
+    """スナップショットの一覧 [(名前, マニフェストのパス, 作成日時)]（新しい順）"""
+    snapshots_dir = os.path.join(backup_dir, SNAPSHOTS_DIR)
+    if not os.path.isdir(snapshots_dir):
+        return []
+
+    snapshots = []
+    for filename in os.listdir(snapshots_dir):
+        if not (filename.startswith(SNAPSHOT_PREFIX) and filename.endswith(".json")):
+            continue
+        name = filename[:-len(".json")]
+        try:
+            created_at = datetime.strptime(name[len(SNAPSHOT_PREFIX):], "%Y%m%d_%H%M%S")
+        except ValueError:
+            continue
+        snapshots.append((name, os.path.join(snapshots_dir, filename), created_at))
+
+    snapshots.sort(key=lambda item: item[2], reverse=True)
+    return snapshots
+
+def collect_garbage(backup_dir):
+    """どのマニフェストからも参照されていないチャンクを削除 (削除数, 削除バイト数)
+
+    store_lock の中で呼ぶ。ロックを使わない古いスクリプトと並行した場合に備えて、
+    開始後に作られたファイルは削除せず、他で削除済みのファイルは無視する
+    """
+    started = time.time()
+    referenced = set()
+    for _, path, _ in list_snapshots(backup_dir):
+        for entry in load_manifest(path)["files"]:
+            referenced.update(entry["chunks"])
+
+    chunks_dir = os.path.join(backup_dir, CHUNKS_DIR)
+    if not os.path.isdir(chunks_dir):
+        return 0, 0
+
+    deleted = 0
+    deleted_bytes = 0
+    for prefix in os.listdir(chunks_dir):
+        prefix_dir = os.path.join(chunks_dir, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for filename in os.listdir(prefix_dir):
+            # 書き込み途中で残った一時ファイルも片付ける
+            digest = filename.split(".", 1)[0]
+            if digest in referenced and not filename.endswith(".tmp"):
+                continue
+            path = os.path.join(prefix_dir, filename)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime >= started:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            deleted_bytes += stat.st_size
+            deleted += 1
+        try:
+            os.rmdir(prefix_dir)
+        except OSError:
+            # 空でない（チャンクが残っている・書き込まれた）
+            pass
+
+    return deleted, deleted_bytes
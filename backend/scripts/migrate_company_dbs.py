@@ -0,0 +1,66 @@
+# backend/scripts/migrate_company_dbs.py
+"""
+既存の会社DB（data/company_*.db）をまとめて最新スキーマに更新するスクリプト
+（インデックス追加などのアップグレードを実行）
+
+使い方:
+  python migrate_company_dbs.py                    # スキーマ更新のみ
+  python migrate_company_dbs.py --rebuild-rollups  # 原価の月次集計も作り直す
+"""
+import os
+import glob
+import sys
+import system_config as config
+from sqlalchemy import create_engine
+from company_database import ensure_company_schema, COMPANY_SCHEMA_VERSION
+from sqlite_pragmas import apply_sqlite_pragmas
+from cost_rollups import rebuild_cost_rollups
+
+def log_info(message):
+    """情報ログ出力"""
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    """エラーログ出力"""
+    print(f"[ERROR] {message}")
+
+def migrate_company_db(db_path, rebuild_rollups=False):
+    """1つの会社DBを最新スキーマに更新（更新したらTrue）"""
+    engine = create_engine(f"sqlite:///{db_path}")
+    apply_sqlite_pragmas(engine, "company")
+    try:
+        upgraded = ensure_company_schema(engine)
+        if rebuild_rollups:
+            with engine.begin() as conn:
+                rebuild_cost_rollups(conn)
+        return upgraded
+    finally:
+        engine.dispose()
+
+def main():
+    """メイン処理"""
+    rebuild_rollups = "--rebuild-rollups" in sys.argv[1:]
+    data_dir = os.path.join(config.APP_DIR, "data")
+    db_files = sorted(glob.glob(os.path.join(data_dir, "company_*.db")))
+    
+    log_info(f"対象: {len(db_files)}件 (スキーマバージョン {COMPANY_SCHEMA_VERSION})")
+    
+    failed = 0
+    for db_path in db_files:
+        name = os.path.basename(db_path)
+        try:
+            if migrate_company_db(db_path, rebuild_rollups):
+                log_info(f"更新: {name}")
+            else:
+                log_info(f"最新: {name}")
+            if rebuild_rollups:
+                log_info(f"月次集計を再作成: {name}")
+        except Exception as e:
+            log_error(f"{name} の更新に失敗: {e}")
+            failed += 1
+    
+    log_info(f"完了: 失敗 {failed}件")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
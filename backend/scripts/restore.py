@@ -1,12 +1,27 @@
 # backend/scripts/restore.py
 """
 バックアップから復旧するスクリプト
+
+使い方:
+  python restore.py                                  # 対話形式で全体を復旧（サービス停止が必要）
+  python restore.py --company 3 --company 5          # 最新のバックアップから会社を指定して復旧
+  python restore.py --company 3 --snapshot backup_20250101_030000
+  python restore.py --company 3 --file ../backups/company_3/backup_20250101_120000.db
+
+会社を指定した復旧はサービスを止めずに実行できる（他の会社には影響しない）
 """
 import os
 import shutil
+import argparse
+import tempfile
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import system_config as config
+import chunk_store
+from sqlalchemy import create_engine
+from company_database import ensure_company_schema, get_company_db_path
+from sqlite_backup import check_integrity, restore_into_live
 
 def log_info(message):
     """情報ログ出力"""
@@ -16,23 +31,31 @@ def log_error(message):
     """エラーログ出力"""
     print(f"\033[0;31m[ERROR]\033[0m {message}")
 
+def _collect_backups():
+    """スナップショット（マニフェスト）と以前の形式のフォルダを合わせた一覧 [(名前, パス, 日時)]"""
+    backups = [
+        (name, manifest_path, created_at)
+        for name, manifest_path, created_at in chunk_store.list_snapshots(config.BACKUP_DIR)
+    ]
+    for item in os.listdir(config.BACKUP_DIR):
+        if item.startswith("backup_"):
+            item_path = os.path.join(config.BACKUP_DIR, item)
+            if os.path.isdir(item_path):
+                mtime = datetime.fromtimestamp(os.path.getmtime(item_path))
+                backups.append((item, item_path, mtime))
+    
+    backups.sort(key=lambda x: x[2], reverse=True)
+    return backups
+
 def find_latest_backup():
-    """最新のバックアップフォルダを探す"""
+    """最新のバックアップ（マニフェストまたはフォルダのパス）を探す"""
     try:
-        backups = []
-        for item in os.listdir(config.BACKUP_DIR):
-            if item.startswith("backup_"):
-                item_path = os.path.join(config.BACKUP_DIR, item)
-                if os.path.isdir(item_path):
-                    mtime = os.path.getmtime(item_path)
-                    backups.append((item_path, mtime))
-        
+        backups = _collect_backups()
         if not backups:
             return None
         
         # 最新のものを返す
-        backups.sort(key=lambda x: x[1], reverse=True)
-        return backups[0][0]
+        return backups[0][1]
         
     except Exception as e:
         log_error(f"バックアップの検索中にエラー: {e}")
@@ -41,23 +64,15 @@ def find_latest_backup():
 def list_backups():
     """利用可能なバックアップを一覧表示"""
     try:
-        backups = []
-        for item in os.listdir(config.BACKUP_DIR):
-            if item.startswith("backup_"):
-                item_path = os.path.join(config.BACKUP_DIR, item)
-                if os.path.isdir(item_path):
-                    mtime = datetime.fromtimestamp(os.path.getmtime(item_path))
-                    backups.append((item, mtime))
+        backups = _collect_backups()
         
         if not backups:
             log_error("バックアップが見つかりません")
             return []
         
-        backups.sort(key=lambda x: x[1], reverse=True)
-        
         print("\n利用可能なバックアップ:")
-        for i, (name, mtime) in enumerate(backups, 1):
-            print(f"  {i}. {name} ({mtime.strftime('%Y-%m-%d %H:%M:%S')})")
+        for i, (name, _, created_at) in enumerate(backups, 1):
+            print(f"  {i}. {name} ({created_at.strftime('%Y-%m-%d %H:%M:%S')})")
         
         return backups
         
@@ -83,6 +98,10 @@ def restore_from_backup(backup_path):
         print("  sudo systemctl stop ecm")
         input("\nサービスを停止したらEnterを押してください...")
         
+        # チャンクストアのスナップショットはマニフェストから組み立てて復旧
+        if backup_path.endswith(".json"):
+            return restore_snapshot(backup_path)
+        
         # master.dbを復旧
         log_info("master.dbを復旧中...")
         master_src = os.path.join(backup_path, "master.db")
@@ -91,14 +110,15 @@ def restore_from_backup(backup_path):
         if os.path.exists(master_src):
             shutil.copy2(master_src, master_dst)
             
-            # WALファイルも復旧
-            wal_src = os.path.join(backup_path, "master.db-wal")
-            shm_src = os.path.join(backup_path, "master.db-shm")
-            
-            if os.path.exists(wal_src):
-                shutil.copy2(wal_src, os.path.join(config.APP_DIR, "master.db-wal"))
-            if os.path.exists(shm_src):
-                shutil.copy2(shm_src, os.path.join(config.APP_DIR, "master.db-shm"))
+            # WALファイルも復旧（オンラインバックアップにはWALがないため、
+            # 残っている現在のWALは復旧したDBに適用されないよう削除）
+            for suffix in ("-wal", "-shm"):
+                src = os.path.join(backup_path, f"master.db{suffix}")
+                dst = os.path.join(config.APP_DIR, f"master.db{suffix}")
+                if os.path.exists(src):
+                    shutil.copy2(src, dst)
+                elif os.path.exists(dst):
+                    os.remove(dst)
         else:
             log_error("バックアップにmaster.dbが見つかりません")
             return False
@@ -127,8 +147,164 @@ def restore_from_backup(backup_path):
         log_error(f"復旧中にエラーが発生: {e}")
         return False
 
+def restore_snapshot(manifest_path):
+    """スナップショットのマニフェストからDBファイルを組み立てて復旧
+
+    全ファイルを作業フォルダに組み立て、チェックサムを確認できてから置き換える
+    """
+    manifest = chunk_store.load_manifest(manifest_path)
+    files = manifest["files"]
+    
+    if not any(entry["path"] == "master.db" for entry in files):
+        log_error("バックアップにmaster.dbが見つかりません")
+        return False
+    
+    staging_dir = os.path.join(config.APP_DIR, ".restore_staging")
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    os.makedirs(os.path.join(staging_dir, "data"))
+    
+    try:
+        for entry in files:
+            log_info(f"{entry['path']}を組み立て中...")
+            chunk_store.restore_file(config.BACKUP_DIR, entry, os.path.join(staging_dir, entry["path"]))
+        
+        # スナップショットはWALの内容を含む完全なファイルなので、残っているWALは削除
+        log_info("master.dbとdataフォルダを置き換え中...")
+        master_dst = os.path.join(config.APP_DIR, "master.db")
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(f"{master_dst}{suffix}"):
+                os.remove(f"{master_dst}{suffix}")
+        os.replace(os.path.join(staging_dir, "master.db"), master_dst)
+        
+        # スナップショットにない会社DBは残さない（以前のdataフォルダ全体の置き換えと同じ）
+        data_dst = os.path.join(config.APP_DIR, "data")
+        if os.path.exists(data_dst):
+            shutil.rmtree(data_dst)
+        os.replace(os.path.join(staging_dir, "data"), data_dst)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    log_info("復旧完了！")
+    print("\n次のステップ:")
+    print("  1. sudo systemctl start ecm でサービスを起動")
+    print("  2. sudo systemctl status ecm でステータス確認")
+    
+    return True
+
+def _find_company_source(backup_path, company_id):
+    """バックアップ内の会社DB（スナップショットならマニフェストのエントリ）"""
+    name = f"data/company_{company_id}.db"
+    if backup_path.endswith(".json"):
+        for entry in chunk_store.load_manifest(backup_path)["files"]:
+            if entry["path"] == name:
+                return entry
+        return None
+    path = os.path.join(backup_path, name)
+    return path if os.path.exists(path) else None
+
+def restore_company(company_id, source, tmp_dir):
+    """1社分を稼働中のまま復旧
+
+    一時ファイルに復元 → integrity_check → スキーマを最新化 → バックアップAPIで
+    稼働中のDBに書き込み。アプリのワーカーがキャッシュしているエンジンはそのまま使える
+    （開いている接続も次のトランザクションから復旧後のデータを参照する）
+    """
+    tmp_path = os.path.join(tmp_dir, f"company_{company_id}.db")
+    if isinstance(source, dict):
+        chunk_store.restore_file(config.BACKUP_DIR, source, tmp_path)
+    else:
+        shutil.copy2(source, tmp_path)
+    
+    errors = check_integrity(tmp_path)
+    if errors:
+        raise ValueError(f"integrity_checkでエラー: {'; '.join(errors[:5])}")
+    
+    # バックアップ時より新しいスキーマのアプリでも使えるようにしてから書き込む
+    engine = create_engine(f"sqlite:///{tmp_path}")
+    try:
+        ensure_company_schema(engine)
+    finally:
+        engine.dispose()
+    
+    os.makedirs("data", exist_ok=True)
+    seconds = restore_into_live(tmp_path, get_company_db_path(company_id))
+    os.remove(tmp_path)
+    return seconds
+
+def restore_companies(company_ids, backup_path=None, file_path=None, workers=2):
+    """指定した会社を並列に復旧（全社成功したらTrue）"""
+    if file_path:
+        if len(company_ids) != 1:
+            log_error("--file を指定する場合は会社を1つだけ指定してください")
+            return False
+        sources = {company_ids[0]: file_path}
+    else:
+        backup_path = backup_path or find_latest_backup()
+        if not backup_path:
+            log_error("バックアップが見つかりません")
+            return False
+        log_info(f"バックアップから復旧: {backup_path}")
+        sources = {}
+        for company_id in company_ids:
+            source = _find_company_source(backup_path, company_id)
+            if source is None:
+                log_error(f"会社ID {company_id}: バックアップに含まれていません")
+                return False
+            sources[company_id] = source
+    
+    success = True
+    with tempfile.TemporaryDirectory(dir=config.BACKUP_TEMP_DIR) as tmp_dir, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            company_id: pool.submit(restore_company, company_id, source, tmp_dir)
+            for company_id, source in sources.items()
+        }
+        for company_id, future in futures.items():
+            try:
+                seconds = future.result()
+                log_info(f"会社ID {company_id}: 復旧完了（{seconds}秒）")
+            except Exception as e:
+                log_error(f"会社ID {company_id}: 復旧失敗（現在のDBは変更していません）: {e}")
+                success = False
+    
+    return success
+
+def _resolve_snapshot(name):
+    """--snapshot の名前からマニフェストまたはフォルダのパスを探す"""
+    for backup_name, path, _ in _collect_backups():
+        if backup_name == name:
+            return path
+    return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ECM バックアップ復旧ツール")
+    parser.add_argument("--company", type=int, action="append", default=[],
+                        help="復旧する会社ID（複数指定可、指定時はサービス稼働中のまま会社単位で復旧）")
+    parser.add_argument("--snapshot", help="復旧元のバックアップ名（省略時は最新）")
+    parser.add_argument("--file", help="復旧元の会社DBファイル（管理画面からのバックアップなど）")
+    parser.add_argument("--workers", type=int, default=config.RESTORE_WORKERS, help="同時に復旧する会社数")
+    return parser.parse_args()
+
 def main():
     """メイン処理"""
+    args = parse_args()
+    
+    # data/ などアプリと同じ相対パスで扱うため、アプリのフォルダで実行
+    if args.file:
+        args.file = os.path.abspath(args.file)
+    os.chdir(config.APP_DIR)
+    
+    if args.company:
+        backup_path = None
+        if args.snapshot:
+            backup_path = _resolve_snapshot(args.snapshot)
+            if not backup_path:
+                log_error(f"バックアップが見つかりません: {args.snapshot}")
+                sys.exit(1)
+        success = restore_companies(args.company, backup_path, args.file, args.workers)
+        sys.exit(0 if success else 1)
+    
     print("=" * 60)
     print("  ECM バックアップ復旧ツール")
     print("=" * 60)
@@ -160,9 +336,7 @@ def main():
         try:
             idx = int(input("バックアップ番号を入力: ")) - 1
             if 0 <= idx < len(backups):
-                backup_name = backups[idx][0]
-                backup_path = os.path.join(config.BACKUP_DIR, backup_name)
-                success = restore_from_backup(backup_path)
+                success = restore_from_backup(backups[idx][1])
             else:
                 log_error("無効な番号です")
                 success = False
@@ -54,6 +54,16 @@ HEALTH_CHECK_TIMEOUT = 10
 
 # ==================== バックアップ設定 ====================
 BACKUP_RETENTION_DAYS = 30
+BACKUP_CHUNK_SIZE = 256 * 1024  # チャンクの大きさ（SQLiteのページサイズの倍数）
+BACKUP_TEMP_DIR = None  # スナップショットの一時保存先（None: OSの一時フォルダ）
+BACKUP_SNAPSHOT_WORKERS = 2  # 同時にスナップショットを取るDBの数
+BACKUP_COMPRESS_WORKERS = 2  # 圧縮を行うプロセス数
+BACKUP_COMPRESSION = "zstd"  # zstd / gzip / none（zstandard未インストールならgzip）
+BACKUP_IO_RATE_MB = 20  # バックアップ先への書き込み速度の上限（MB/秒、0で無制限）
+RESTORE_WORKERS = 2  # 会社単位の復旧で同時に処理する会社数
+VERIFY_WORKERS = 2  # バックアップ検証のプロセス数
+VERIFY_MAX_ROW_DROP = 0.5  # 前回の検証から件数がこの割合以上減ったらエラー
+VERIFY_MIN_ROWS = 20  # 件数の比較を行う最小件数（少ないテーブルは比較しない）
 
 # ==================== ディスク容量設定 ====================
 if ENVIRONMENT == 'production':
@@ -0,0 +1,220 @@
+# backend/scripts/verify_backups.py
+"""
+バックアップ検証スクリプト
+バックアップ一覧（backup_catalog）の未検証のバックアップを読み取り専用で開き、
+PRAGMA quick_check（--full で integrity_check）と件数のチェックを行う。
+結果は backup_verifications に記録し、失敗があればメールで通知する
+毎日バックアップの後に自動実行（systemdタイマーで設定）
+
+使い方:
+  python verify_backups.py            # 未検証のバックアップを検証
+  python verify_backups.py --all      # すべて再検証
+  python verify_backups.py --full     # integrity_check で検証（時間がかかる）
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import system_config as config
+import chunk_store
+from send_email import send_alert_email
+from sqlalchemy import create_engine
+from sqlite_pragmas import apply_sqlite_pragmas
+from master_database import MasterSessionLocal, BackupCatalog, BackupVerification
+
+# master.db はアプリのフォルダの絶対パスで開く（カレントディレクトリに関係なく同じDBを検証・記録）
+_master_engine = apply_sqlite_pragmas(
+    create_engine(f"sqlite:///{os.path.join(config.APP_DIR, 'master.db')}"), "master"
+)
+
+def log_info(message):
+    """情報ログ出力"""
+    print(f"[INFO] {message}")
+
+def log_error(message):
+    """エラーログ出力"""
+    print(f"[ERROR] {message}")
+
+def _resolve_location(location):
+    """一覧の保存場所（アプリが記録した ./backups/... はアプリのフォルダからの相対パス）を絶対パスに"""
+    return os.path.normpath(os.path.join(config.APP_DIR, location))
+
+def _check_db(path, check_type):
+    """DBを読み取り専用で開いてチェック (エラー一覧, {テーブル: 件数})"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+    try:
+        rows = [row[0] for row in conn.execute(f"PRAGMA {check_type}").fetchall()]
+        errors = [] if rows == ["ok"] else rows
+        # 全テーブルを最後まで読めること、件数を前回と比較するために集計
+        tables = [
+            name for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+            ).fetchall()
+        ]
+        row_counts = {
+            table: conn.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0]
+            for table in tables
+        }
+    finally:
+        conn.close()
+    return errors, row_counts
+
+def verify_one(task):
+    """1件のバックアップを検証（ワーカープロセスで実行）"""
+    started = time.monotonic()
+    result = {"catalog_id": task["catalog_id"], "ok": False, "detail": None, "row_counts": None}
+    try:
+        if task["kind"] == "snapshot":
+            # チャンクから一時ファイルに組み立て（チャンクとファイル全体のチェックサムも確認される）
+            manifest = chunk_store.load_manifest(task["location"])
+            entry = next((f for f in manifest["files"] if f["path"] == task["filename"]), None)
+            if entry is None:
+                raise FileNotFoundError(f"マニフェストに {task['filename']} がありません")
+            with tempfile.TemporaryDirectory(dir=config.BACKUP_TEMP_DIR) as tmp_dir:
+                tmp_path = os.path.join(tmp_dir, "verify.db")
+                chunk_store.restore_file(task["backup_dir"], entry, tmp_path)
+                errors, row_counts = _check_db(tmp_path, task["check_type"])
+        else:
+            if not os.path.exists(task["location"]):
+                raise FileNotFoundError(task["location"])
+            errors, row_counts = _check_db(task["location"], task["check_type"])
+
+        result["row_counts"] = row_counts
+        if errors:
+            result["detail"] = "; ".join(errors[:10])
+        else:
+            result["ok"] = True
+    except Exception as e:
+        result["detail"] = f"{type(e).__name__}: {e}"
+
+    result["duration_sec"] = round(time.monotonic() - started, 3)
+    return result
+
+def check_row_counts(row_counts, previous_counts):
+    """前回検証した同じDBのバックアップと比べて件数が大きく減ったテーブル"""
+    if not row_counts or not previous_counts:
+        return []
+    dropped = []
+    for table, previous in previous_counts.items():
+        current = row_counts.get(table)
+        if current is None:
+            dropped.append(f"{table}: テーブルがありません")
+        elif previous >= config.VERIFY_MIN_ROWS and current < previous * (1 - config.VERIFY_MAX_ROW_DROP):
+            dropped.append(f"{table}: {previous}件 → {current}件")
+    return dropped
+
+def _previous_counts(db, backup):
+    """同じDB（同じ種類・同じ会社）の以前のバックアップで、最後に成功した検証の件数"""
+    filters = [
+        BackupCatalog.kind == backup.kind,
+        BackupCatalog.created_at < backup.created_at,
+        BackupVerification.ok == True
+    ]
+    if backup.company_id is None:
+        filters.append(BackupCatalog.company_id.is_(None))
+    else:
+        filters.append(BackupCatalog.company_id == backup.company_id)
+    if backup.kind == "snapshot":
+        filters.append(BackupCatalog.filename == backup.filename)
+
+    previous = db.query(BackupVerification.row_counts).join(
+        BackupCatalog, BackupCatalog.id == BackupVerification.catalog_id
+    ).filter(*filters).order_by(BackupCatalog.created_at.desc()).first()
+    return previous.row_counts if previous else None
+
+def verify_backups(verify_all=False, full=False, workers=None):
+    """バックアップを検証して結果を記録（失敗数を返す）"""
+    check_type = "integrity_check" if full else "quick_check"
+    db = MasterSessionLocal(bind=_master_engine)
+    try:
+        query = db.query(BackupCatalog)
+        if not verify_all:
+            verified = db.query(BackupVerification.catalog_id)
+            query = query.filter(~BackupCatalog.id.in_(verified))
+        backups = query.order_by(BackupCatalog.created_at).all()
+
+        if not backups:
+            log_info("検証するバックアップはありません")
+            return 0
+
+        log_info(f"{len(backups)}件のバックアップを検証中（{check_type}、並列数 {workers or config.VERIFY_WORKERS}）...")
+        started = time.monotonic()
+        tasks = [
+            {
+                "catalog_id": backup.id,
+                "kind": backup.kind,
+                "location": _resolve_location(backup.location),
+                "filename": backup.filename,
+                "backup_dir": config.BACKUP_DIR,
+                "check_type": check_type
+            }
+            for backup in backups
+        ]
+        by_id = {backup.id: backup for backup in backups}
+
+        failures = []
+        with ProcessPoolExecutor(max_workers=workers or config.VERIFY_WORKERS) as pool:
+            # 古い順に記録し、件数の比較は直前に記録した結果も使う
+            for result in pool.map(verify_one, tasks):
+                backup = by_id[result["catalog_id"]]
+                if result["ok"]:
+                    dropped = check_row_counts(result["row_counts"], _previous_counts(db, backup))
+                    if dropped:
+                        result["ok"] = False
+                        result["detail"] = "件数が大きく減少: " + "; ".join(dropped)
+
+                db.add(BackupVerification(
+                    catalog_id=backup.id,
+                    verified_at=datetime.now(),
+                    ok=result["ok"],
+                    check_type=check_type,
+                    duration_sec=result["duration_sec"],
+                    row_counts=result["row_counts"],
+                    detail=result["detail"]
+                ))
+                db.commit()
+
+                label = f"{backup.location} ({backup.filename})" if backup.kind == "snapshot" else backup.location
+                if result["ok"]:
+                    log_info(f"  OK: {label}（{result['duration_sec']}秒）")
+                else:
+                    log_error(f"  NG: {label}: {result['detail']}")
+                    failures.append(f"{label}\n  {result['detail']}")
+
+        log_info(f"検証完了: {len(backups) - len(failures)}件OK / {len(failures)}件NG（{time.monotonic() - started:.1f}秒）")
+
+        if failures:
+            send_alert_email(
+                "❌ バックアップ検証エラー",
+                f"{len(failures)}件のバックアップで問題が見つかりました。\n\n" + "\n\n".join(failures[:50])
+            )
+        return len(failures)
+    finally:
+        db.close()
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="ECM バックアップ検証ツール")
+    parser.add_argument("--all", action="store_true", help="検証済みのバックアップも再検証")
+    parser.add_argument("--full", action="store_true", help="quick_check ではなく integrity_check で検証")
+    parser.add_argument("--workers", type=int, help="並列数（省略時は VERIFY_WORKERS）")
+    args = parser.parse_args()
+
+    try:
+        failures = verify_backups(args.all, args.full, args.workers)
+    except Exception as e:
+        log_error(f"検証中にエラーが発生: {e}")
+        send_alert_email(
+            "❌ バックアップ検証エラー",
+            f"バックアップの検証処理中にエラーが発生しました。\n\nエラー内容:\n{e}"
+        )
+        sys.exit(1)
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# backend/settings_cache.py - 会社ごとのシステム設定キャッシュ
+import threading
+from collections import namedtuple
+from company_models import SystemSettings
+from table_versions import get_table_version, bump_table_version
+
+SETTINGS_TABLE = "system_settings"
+
+# キャッシュする設定の内容（ORMオブジェクトと同じ属性名）
+CachedSetting = namedtuple(
+    "CachedSetting",
+    ["key", "value", "fiscal_start_year", "fiscal_start_month", "staff_code_digits"]
+)
+
+# company_id -> (バージョン, {key: CachedSetting})
+_cache = {}
+_cache_lock = threading.Lock()
+
+def get_settings_map(db) -> dict:
+    """会社の設定を {key: CachedSetting} で取得
+
+    会社DBのバージョンが変わっていなければキャッシュを返す（他ワーカーの更新も検知できる）
+    """
+    company_id = db.info["company_id"]
+    version = get_table_version(db, SETTINGS_TABLE)
+
+    with _cache_lock:
+        cached = _cache.get(company_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    settings_map = {}
+    for setting in db.query(SystemSettings).order_by(SystemSettings.id).all():
+        # 同じキーが複数ある場合は最初の行を使う（.first() と同じ）
+        if setting.key not in settings_map:
+            settings_map[setting.key] = CachedSetting(
+                setting.key,
+                setting.value,
+                setting.fiscal_start_year,
+                setting.fiscal_start_month,
+                setting.staff_code_digits
+            )
+
+    with _cache_lock:
+        _cache[company_id] = (version, settings_map)
+    return settings_map
+
+def get_setting(db, key: str):
+    """設定を1件取得（なければNone）"""
+    return get_settings_map(db).get(key)
+
+def invalidate_settings(db):
+    """設定の更新時に呼ぶ（commit前に呼び、同じトランザクションでバージョンを上げる）"""
+    bump_table_version(db, SETTINGS_TABLE)
+    with _cache_lock:
+        _cache.pop(db.info["company_id"], None)
@@ -0,0 +1,95 @@
+# backend/sqlite_backup.py - SQLiteのオンラインバックアップ（稼働中のDBから一貫したスナップショットを作成）
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from config import SQLITE_BACKUP_PAGES_PER_STEP, SQLITE_BACKUP_STEP_SLEEP
+
+BackupResult = namedtuple("BackupResult", ["path", "bytes", "seconds", "pages"])
+
+def online_backup(src_path: str, dest_path: str,
+                  pages_per_step: int = SQLITE_BACKUP_PAGES_PER_STEP,
+                  step_sleep: float = SQLITE_BACKUP_STEP_SLEEP) -> BackupResult:
+    """src_path を dest_path にバックアップ
+
+    sqlite3のバックアップAPIで pages_per_step ページずつコピーし、ステップ間で
+    step_sleep 秒待つ（稼働中のリクエストのI/Oを優先）。WALの内容も含まれる。
+    WALモードでは読み取りトランザクションを保持するため、コピー中に書き込みが
+    あってもバックアップ開始時点のスナップショットになる。
+    一時ファイルに書いてから置き換えるので、途中で失敗しても壊れたファイルは残らない
+    """
+    if not os.path.exists(src_path):
+        raise FileNotFoundError(src_path)
+
+    started = time.monotonic()
+    tmp_path = f"{dest_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    src = sqlite3.connect(src_path, timeout=30, isolation_level=None)
+    dest = sqlite3.connect(tmp_path, isolation_level=None)
+    total_pages = 0
+    try:
+        journal_mode = src.execute("PRAGMA journal_mode").fetchone()[0]
+        snapshot = journal_mode.lower() == "wal"
+        if snapshot:
+            # 読み取りトランザクションを開始してスナップショットを固定
+            src.execute("BEGIN")
+            src.execute("SELECT count(*) FROM sqlite_master").fetchone()
+
+        def progress(status, remaining, total):
+            nonlocal total_pages
+            total_pages = total
+            if remaining and step_sleep > 0:
+                time.sleep(step_sleep)
+
+        try:
+            src.backup(dest, pages=pages_per_step, progress=progress)
+        finally:
+            if snapshot:
+                src.execute("COMMIT")
+
+        # バックアップは単体のファイルとして扱えるようにWALを使わない形式にする
+        dest.execute("PRAGMA journal_mode=DELETE")
+    except BaseException:
+        dest.close()
+        src.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    dest.close()
+    src.close()
+    os.replace(tmp_path, dest_path)
+
+    return BackupResult(
+        path=dest_path,
+        bytes=os.path.getsize(dest_path),
+        seconds=round(time.monotonic() - started, 3),
+        pages=total_pages
+    )
+
+def check_integrity(path: str):
+    """PRAGMA integrity_check の結果（問題なければ空リスト）"""
+    conn = sqlite3.connect(path)
+    try:
+        rows = [row[0] for row in conn.execute("PRAGMA integrity_check").fetchall()]
+    finally:
+        conn.close()
+    return [] if rows == ["ok"] else rows
+
+def restore_into_live(src_path: str, dest_path: str, busy_timeout: float = 30):
+    """src_path の内容で稼働中の dest_path を置き換える
+
+    ファイルの置き換えではなくバックアップAPIで1トランザクションとして書き込むため、
+    WALモードで接続中のプロセスがあっても安全（読み取り中の接続は完了まで旧内容を参照）
+    """
+    started = time.monotonic()
+    src = sqlite3.connect(src_path)
+    dest = sqlite3.connect(dest_path, timeout=busy_timeout, isolation_level=None)
+    try:
+        src.backup(dest)
+    finally:
+        dest.close()
+        src.close()
+    return round(time.monotonic() - started, 3)
@@ -0,0 +1,36 @@
+# backend/sqlite_pragmas.py - SQLiteのPRAGMA設定
+from sqlalchemy import event
+from config import SQLITE_PROFILE, SQLITE_PROFILES
+
+# 確認用に読み出すPRAGMA
+PRAGMA_NAMES = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout")
+
+def get_pragma_profile(db_type: str) -> dict:
+    """設定中のプロファイルから master / company 用のPRAGMAを取得"""
+    profile = SQLITE_PROFILES.get(SQLITE_PROFILE, SQLITE_PROFILES["default"])
+    return profile.get(db_type, {})
+
+def apply_sqlite_pragmas(engine, db_type: str):
+    """接続ごとにPRAGMAを適用するイベントを登録"""
+    pragmas = get_pragma_profile(db_type)
+    if not pragmas:
+        return engine
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+def read_sqlite_pragmas(engine) -> dict:
+    """実際に有効になっているPRAGMAの値を取得"""
+    with engine.connect() as conn:
+        return {
+            name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in PRAGMA_NAMES
+        }
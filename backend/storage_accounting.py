@@ -0,0 +1,220 @@
+# backend/storage_accounting.py - 会社ごとの使用容量をバックグラウンドで集計してマスターDBに記録
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from config import STORAGE_ACCOUNTING_INTERVAL, STORAGE_SAMPLE_RETENTION_DAYS
+
+try:
+    import fcntl
+except ImportError:  # Windows（開発環境）ではロックなし
+    fcntl = None
+
+DATA_DIR = "./data"
+BACKUP_DIR = "./backups"
+LOCK_PATH = "./data/.storage_accounting.lock"
+
+_DB_FILE_PATTERN = re.compile(r"^company_(\d+)\.db(-wal|-shm)?$")
+_BACKUP_DIR_PATTERN = re.compile(r"^company_(\d+)$")
+
+# ファイルの (サイズ, 更新時刻) の前回値、変化がなければマスターDBに書き込まない
+_last_signature = None
+_wakeup = threading.Event()
+_stop_event = threading.Event()
+_thread = None
+_last_run = {"started_at": None, "seconds": 0.0, "companies": 0, "changed": 0, "skipped": None}
+
+def _dir_size(path):
+    """フォルダ以下のファイルサイズの合計と最終更新時刻"""
+    total = 0
+    latest = 0.0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            total += stat.st_size
+            latest = max(latest, stat.st_mtime)
+    return total, latest
+
+def scan_storage():
+    """会社ごとの {db, wal, backup} バイト数と、変化検出用のシグネチャを返す"""
+    sizes = {}
+    signature = []
+
+    def usage(company_id):
+        return sizes.setdefault(company_id, {"db_bytes": 0, "wal_bytes": 0, "backup_bytes": 0})
+
+    if os.path.isdir(DATA_DIR):
+        with os.scandir(DATA_DIR) as entries:
+            for entry in entries:
+                match = _DB_FILE_PATTERN.match(entry.name)
+                if not match:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                field = "wal_bytes" if match.group(2) else "db_bytes"
+                usage(int(match.group(1)))[field] += stat.st_size
+                signature.append((entry.name, stat.st_size, stat.st_mtime))
+
+    if os.path.isdir(BACKUP_DIR):
+        with os.scandir(BACKUP_DIR) as entries:
+            for entry in entries:
+                match = _BACKUP_DIR_PATTERN.match(entry.name)
+                if not match or not entry.is_dir():
+                    continue
+                size, latest = _dir_size(entry.path)
+                usage(int(match.group(1)))["backup_bytes"] += size
+                signature.append((entry.name, size, latest))
+
+    return sizes, tuple(sorted(signature))
+
+def record_storage(db, sizes):
+    """集計結果を storage_usage / storage_samples / companies.storage_used_mb に反映
+
+    変化した会社だけ書き込み、変化した会社数を返す
+    """
+    from master_database import Company, StorageUsage, StorageSample
+
+    now = datetime.now()
+    company_ids = {company_id for (company_id,) in db.query(Company.id).all()}
+    current = {usage.company_id: usage for usage in db.query(StorageUsage).all()}
+    changed = 0
+
+    for company_id in company_ids:
+        values = sizes.get(company_id, {"db_bytes": 0, "wal_bytes": 0, "backup_bytes": 0})
+        total = values["db_bytes"] + values["wal_bytes"] + values["backup_bytes"]
+        usage = current.get(company_id)
+        if usage is not None and (usage.db_bytes, usage.wal_bytes, usage.backup_bytes) == (
+            values["db_bytes"], values["wal_bytes"], values["backup_bytes"]
+        ):
+            continue
+
+        if usage is None:
+            usage = StorageUsage(company_id=company_id)
+            db.add(usage)
+        usage.db_bytes = values["db_bytes"]
+        usage.wal_bytes = values["wal_bytes"]
+        usage.backup_bytes = values["backup_bytes"]
+        usage.total_bytes = total
+        usage.updated_at = now
+
+        db.add(StorageSample(company_id=company_id, sampled_at=now, total_bytes=total, **values))
+        db.query(Company).filter(Company.id == company_id).update(
+            {Company.storage_used_mb: round(total / 1024 / 1024)},
+            synchronize_session=False
+        )
+        changed += 1
+
+    # 削除済みの会社と古い履歴を片付け
+    removed = set(current) - company_ids
+    if removed:
+        db.query(StorageUsage).filter(StorageUsage.company_id.in_(removed)).delete(synchronize_session=False)
+    db.query(StorageSample).filter(
+        StorageSample.sampled_at < now - timedelta(days=STORAGE_SAMPLE_RETENTION_DAYS)
+    ).delete(synchronize_session=False)
+
+    db.commit()
+    return changed
+
+def _read_last_run(lock_file):
+    """ロックファイルに記録された、いずれかのワーカーが最後に集計した時刻"""
+    lock_file.seek(0)
+    try:
+        return float(lock_file.read().strip() or 0)
+    except ValueError:
+        return 0.0
+
+def _write_last_run(lock_file, timestamp):
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(timestamp))
+    lock_file.flush()
+
+def run_storage_accounting(force: bool = False):
+    """1回分の集計
+
+    ロック中（他ワーカーが実行中）や、他ワーカーが間隔内に集計済みの場合はスキップ。
+    ファイルに変化がなければマスターDBには書き込まない。force=True は間隔を無視する
+    """
+    global _last_signature
+    from master_database import MasterSessionLocal
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(LOCK_PATH, "a+") as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                _last_run["skipped"] = "locked"
+                return False
+
+        now = time.time()
+        if not force and now - _read_last_run(lock_file) < STORAGE_ACCOUNTING_INTERVAL:
+            _last_run["skipped"] = "recent"
+            return False
+
+        started = time.monotonic()
+        sizes, signature = scan_storage()
+        if signature == _last_signature:
+            _write_last_run(lock_file, now)
+            _last_run["skipped"] = "unchanged"
+            return False
+
+        db = MasterSessionLocal()
+        try:
+            changed = record_storage(db, sizes)
+        finally:
+            db.close()
+        _last_signature = signature
+        _write_last_run(lock_file, now)
+
+        _last_run.update({
+            "started_at": datetime.now(),
+            "seconds": round(time.monotonic() - started, 3),
+            "companies": len(sizes),
+            "changed": changed,
+            "skipped": None
+        })
+        return True
+
+def request_storage_accounting():
+    """ファイルを変更した処理（バックアップ・削除など）から次の集計を前倒しする"""
+    _wakeup.set()
+
+def get_storage_accounting_status():
+    """このワーカーでの直近の集計結果（監視用）"""
+    return {
+        **_last_run,
+        "interval_sec": STORAGE_ACCOUNTING_INTERVAL,
+        "running": _thread is not None and _thread.is_alive()
+    }
+
+def _accounting_loop():
+    # 初回と前倒し要求時は間隔に関係なく集計
+    force = True
+    while not _stop_event.is_set():
+        try:
+            run_storage_accounting(force=force)
+        except Exception as e:
+            print(f"⚠️ 使用容量の集計に失敗: {e}")
+        force = _wakeup.wait(STORAGE_ACCOUNTING_INTERVAL)
+        _wakeup.clear()
+
+def start_storage_accounting():
+    """バックグラウンド集計を開始（起動時に1回呼ぶ）"""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop_event.clear()
+    _thread = threading.Thread(target=_accounting_loop, name="storage-accounting", daemon=True)
+    _thread.start()
+
+def stop_storage_accounting():
+    """バックグラウンド集計を停止"""
+    _stop_event.set()
+    _wakeup.set()
@@ -0,0 +1,23 @@
+# backend/table_versions.py - 会社DBのテーブル更新バージョン
+import time
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from company_models import TableVersion
+
+def get_table_version(db, name: str) -> int:
+    """テーブルの現在のバージョン（未登録なら0）"""
+    version = db.query(TableVersion.version).filter(TableVersion.name == name).scalar()
+    return version or 0
+
+def bump_table_version(db, name: str):
+    """テーブルのバージョンを上げる（呼び出し側のトランザクション内で実行）
+
+    バックアップから戻した後も以前の値と重ならないよう、ミリ秒時刻以上の値にする
+    """
+    now_ms = int(time.time() * 1000)
+    stmt = sqlite_insert(TableVersion).values(name=name, version=now_ms)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"version": func.max(TableVersion.version + 1, now_ms)}
+    )
+    db.execute(stmt)